@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from collections import deque
+
+import numpy as np
+
+"""
+Self tuning thresholds for the starting positions
+
+A starting position is only solved if enough of its entangles can be done straight away
+and its distance function is low enough. Set too tight, most positions are thrown away or
+the program runs out of attempts, and set too loose, trials are wasted on bad positions.
+
+Instead of fixed values, these thresholds follow the positions that are actually being made.
+Every candidate position is recorded, along with the average swaps of the positions that get
+solved. After a few positions have been solved with no thresholds at all, each threshold is
+set to the given quantile of the recent candidates, so about that fraction of them pass it.
+A threshold is only used while it actually predicts the swaps, which is when positions with
+more initial entangles, or a lower distance function, have needed fewer swaps so far.
+The thresholds given on the command line are still the loosest they can be.
+"""
+
+
+class AdaptiveThresholds:
+
+    def __init__(self, quantile, init_entangles_frac, init_graph_dist, warmup=5, window=500):
+
+        # The fraction of candidate positions each threshold lets through
+        self.quantile = quantile
+
+        # The fixed thresholds, which the adaptive ones are never looser than
+        self.min_entangles_frac = init_entangles_frac
+        self.max_graph_dist = init_graph_dist
+
+        # The current thresholds, which start out as the fixed ones
+        self.entangles_frac = init_entangles_frac
+        self.graph_dist = init_graph_dist
+
+        # How many positions are solved before the thresholds start to move
+        self.warmup = warmup
+
+        # The initial entangle fraction and distance function of the most recent candidates
+        self.cand_entangles_fracs = deque(maxlen=window)
+        self.cand_graph_dists = deque(maxlen=window)
+
+        # The same for every position that was solved, with the average swaps of its trials
+        self.entangles_fracs = []
+        self.graph_dists = []
+        self.ave_swaps = []
+
+    def accepts(self, entangles_frac, graph_dist):
+
+        return entangles_frac >= self.entangles_frac and graph_dist <= self.graph_dist
+
+    def add_candidate(self, entangles_frac, graph_dist):
+
+        self.cand_entangles_fracs.append(entangles_frac)
+        self.cand_graph_dists.append(graph_dist)
+
+    # Records how a solved position did, and moves the thresholds to match
+    def add_solved(self, entangles_frac, graph_dist, ave_swaps):
+
+        self.entangles_fracs.append(entangles_frac)
+        self.graph_dists.append(graph_dist)
+        self.ave_swaps.append(ave_swaps)
+
+        self.update()
+
+    def update(self):
+
+        if len(self.ave_swaps) < self.warmup:
+            return
+
+        ave_swaps = np.array(self.ave_swaps, dtype=float)
+
+        # More initial entangles should mean fewer swaps, so the fraction has to be at least the
+        # lower quantile of the candidates
+        if calc_correlation(self.entangles_fracs, ave_swaps) < 0:
+            self.entangles_frac = max(float(np.quantile(self.cand_entangles_fracs, 1 - self.quantile)), self.min_entangles_frac)
+        else:
+            self.entangles_frac = self.min_entangles_frac
+
+        # A lower distance function should mean fewer swaps, so it has to be at most the
+        # upper quantile of the candidates
+        if calc_correlation(self.graph_dists, ave_swaps) > 0:
+            self.graph_dist = min(float(np.quantile(self.cand_graph_dists, self.quantile)), self.max_graph_dist)
+        else:
+            self.graph_dist = self.max_graph_dist
+
+    # Goes back to the fixed thresholds, for when too many positions in a row have been thrown away
+    # The thresholds move again after the next position is solved
+    def relax(self):
+
+        self.entangles_frac = self.min_entangles_frac
+        self.graph_dist = self.max_graph_dist
+
+
+# The correlation between the two lists, or 0 if either of them never changes
+def calc_correlation(values1, values2):
+
+    values1 = np.asarray(values1, dtype=float)
+    values2 = np.asarray(values2, dtype=float)
+
+    if values1.std() == 0 or values2.std() == 0:
+        return 0.0
+
+    return float(np.corrcoef(values1, values2)[0, 1])
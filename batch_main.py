@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+import optimization_funcs as ofs
+from post_processing_funcs import post_process_moves
+from schedule_funcs import calc_depth
+
+"""
+This runs the minimum swap algorithm on many circuits in one go
+
+ Every lattice and its path lengths are only worked out once, and the circuits are
+ split between a pool of worker processes.
+ One JSON record is written per circuit as soon as it is finished, so the output file
+ can be read while the batch is still running.
+"""
+"""
+Arguments:
+    The inputs are directories, .txt/.qasm files or glob patterns
+    All other arguments are flags for some or another functionality
+"""
+
+# File types that can be read as a variable graph
+input_extensions = (".txt", ".qasm")
+
+
+"""
+Functions for the Batch
+"""
+
+
+# This turns the directories, files and glob patterns given into a list of input files
+def find_inputs(patterns):
+
+    inputs = []
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            inputs += sorted(os.path.join(pattern, file) for file in os.listdir(pattern) if file.endswith(input_extensions))
+        elif glob.has_magic(pattern):
+            inputs += sorted(file for file in glob.glob(pattern) if file.endswith(input_extensions))
+        else:
+            inputs.append(pattern)
+
+    return inputs
+
+
+# These are the lattices and settings every worker uses, which are set up when each worker starts
+_lattices = None
+_settings = None
+
+
+def _init_worker(lattices, settings):
+
+    global _lattices, _settings
+    _lattices = lattices
+    _settings = settings
+
+
+# This solves one circuit on one lattice and returns its record
+# Anything that stops the run, including the quit() calls in the algorithm, is recorded as an
+# error for that circuit instead of ending the whole batch
+def _solve_circuit(task):
+
+    filepath, architecture, seed = task
+    lattice_Graph, lattice_tables = _lattices[architecture]
+
+    record = {"input": filepath, "architecture": architecture, "seed": seed}
+
+    output = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(output):
+            QUBO_Graph, num_nodes, num_edges, list_nodes = ofs.make_qubo_graph(filepath)
+            QUBO_Graph = ofs.find_greens(QUBO_Graph)
+
+            start_time = time.perf_counter()
+            best_moves_list, best_moves_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, iterations, graph_distance, init_entangles, ave_swap_list, attempts = ofs.iterate_through(lattice_Graph,
+                                                                                                                                                                                               QUBO_Graph,
+                                                                                                                                                                                               _settings["iterations"],
+                                                                                                                                                                                               _settings["no_truncate"],
+                                                                                                                                                                                               _settings["init_entangles_frac"],
+                                                                                                                                                                                               _settings["init_graph_dist"],
+                                                                                                                                                                                               seed=seed,
+                                                                                                                                                                                               lattice_tables=lattice_tables,
+                                                                                                                                                                                               objective=_settings["objective"],
+                                                                                                                                                                                               placement_search=_settings["placement_search"],
+                                                                                                                                                                                               threshold_quantile=_settings["threshold_quantile"],
+                                                                                                                                                                                               dedupe_layouts=_settings["dedupe_layouts"],
+                                                                                                                                                                                               trial_allocation=_settings["trial_allocation"],
+                                                                                                                                                                                               router=_settings["router"],
+                                                                                                                                                                                               beam_width=_settings["beam_width"],
+                                                                                                                                                                                               batch_trials=_settings["batch_trials"])
+            run_time = time.perf_counter() - start_time
+
+            # Merge swaps into the gates next to them and drop swaps that undo each other
+            best_moves_list, best_moves_key = post_process_moves(lattice_Graph, QUBO_Graph, best_lattice_nodes, best_moves_list, best_moves_key)
+
+    except (Exception, SystemExit) as error:
+        record["error"] = f"{type(error).__name__}: {error}".strip(": ")
+        last_line = output.getvalue().strip().split("\n")[-1]
+        if last_line:
+            record["error"] += f" ({last_line})"
+        return record
+
+    record["num_qubits"] = num_nodes
+    record["num_entangles"] = num_edges
+    record["iterations"] = iterations
+    record["run_time"] = run_time
+    record["best_swaps"] = best_moves_key.count("s")
+    record["depth"] = calc_depth(best_lattice_nodes, best_moves_list, best_moves_key)
+    record["mean_swaps"] = float(np.average(list_of_swap_nums))
+
+    # The starting position of each variable on the lattice, followed by the moves from there
+    record["embedding"] = {str(qubit): best_qubo_embed[qubit] for qubit in QUBO_Graph.nodes}
+    record["moves"] = [[list(move), key] for move, key in zip(best_moves_list, best_moves_key)]
+
+    return record
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+                        prog='batch_main.py',
+                        description='Finds the minimum swap path for many circuits')
+
+    # Input graph arguments
+    parser.add_argument('inputs', nargs='+',
+                        help="Directories, .txt or .qasm files, or glob patterns of the files listing which "
+                        "variables need to be entangled with each other.")
+
+    # Lattice arguments
+    parser.add_argument('-a', '--architectures', nargs='+', choices=["Hex", "HHex"], default=["HHex"],
+                        help="The physical structures of the qubit connections in the quantum computer to "
+                        "solve every circuit on. Either \'Hex\' for hexagonal or \'HHex\' for a heavy hexagonal structure.\n"
+                        "(default: HHex)")
+
+    # Optimization arguments
+    parser.add_argument('-i', '--iterations', default=1_000, type=int,
+                        help="The number of attempts to find the minimum swap path for each circuit.\n"
+                        "(default: 1_000)")
+    parser.add_argument('-ef', '--init_entangles_frac', default=0.0, type=float,
+                        help="The minimum fraction of qubit pairs a starting position must entangle without "
+                        "any SWAP gates or free swaps, as in main.py.\n"
+                        "(default: 0.0)")
+    parser.add_argument('-gd', '--init_graph_dist', default=10_000, type=float,
+                        help="The maximum distance function of a starting position, as in main.py.\n"
+                        "(default: 10_000)")
+    parser.add_argument('-at', '--adaptive_thresholds', nargs='?', const=0.5, default=None, type=float,
+                        help="If given, the -ef and -gd thresholds move on their own to let about this fraction "
+                        "of the starting positions through, as in main.py. On its own, the fraction is 0.5.\n"
+                        "(default: None)")
+    parser.add_argument('-dl', '--dedupe_layouts', action='store_true', default=False,
+                        help="If true, starting positions that were already tried, up to the symmetries of the "
+                        "lattice, get fewer trials, as in main.py.\n"
+                        "(default: False)")
+    parser.add_argument('-ta', '--trial_allocation', choices=["fixed", "halving"], default="fixed",
+                        help="How the trials are shared out between the starting positions, as in main.py.\n"
+                        "(default: fixed)")
+    parser.add_argument('-rt', '--router', choices=["greedy", "beam"], default="greedy",
+                        help="How each trial moves the qubits, as in main.py.\n"
+                        "(default: greedy)")
+    parser.add_argument('-bw', '--beam_width', default=8, type=int,
+                        help="The number of partial paths the beam search keeps, as in main.py.\n"
+                        "(default: 8)")
+    parser.add_argument('-bt', '--batch_trials', default=None, type=int,
+                        help="If given, every starting position gets this many trials, which are run together as one "
+                        "batch, as in main.py.\n"
+                        "(default: None)")
+    parser.add_argument('-nt', '--no_truncate', action='store_true', default=False,
+                        help="If false, will stop solving the graph once the number of swaps in that solution "
+                        "meets or exceeds the current minimum number of swaps.\n"
+                        "(default: False)")
+    parser.add_argument('-ps', '--placement_search', choices=["random", "steepest", "tabu"], default="random",
+                        help="How each starting position is improved before it is solved, as in main.py.\n"
+                        "(default: random)")
+    parser.add_argument('-obj', '--objective', choices=["swaps", "depth"], default="swaps",
+                        help="Whether to look for the path with the fewest swaps, or the path with the fewest "
+                        "layers of gates and swaps that run at the same time, as in main.py.\n"
+                        "(default: swaps)")
+    parser.add_argument('-s', '--seed', default=None, type=int,
+                        help="A seed to make the whole batch repeatable. Each circuit gets its own seed from it.\n"
+                        "(default: None)")
+
+    # Batch arguments
+    parser.add_argument('-w', '--workers', default=os.cpu_count(), type=int,
+                        help="The number of processes to split the circuits between.\n"
+                        "(default: the number of CPUs)")
+    parser.add_argument('-o', '--output', default="batch_results.jsonl",
+                        help="The file the results are written to, with one JSON record per line.\n"
+                        "(default: batch_results.jsonl)")
+
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.inputs)
+
+    if not inputs:
+        print("No input files were found.")
+        print("Exiting program...")
+        quit()
+
+    # The lattices are made once here and handed to every worker
+    print("Creating lattice graphs...")
+
+    lattices = {}
+    for architecture in args.architectures:
+        lattice_Graph = ofs.import_lattice(architecture)
+        lattices[architecture] = (lattice_Graph, lattice_Graph.graph['lattice_tables'])
+
+    settings = {"iterations": args.iterations,
+                "no_truncate": args.no_truncate,
+                "init_entangles_frac": args.init_entangles_frac,
+                "init_graph_dist": args.init_graph_dist,
+                "objective": args.objective,
+                "placement_search": args.placement_search,
+                "threshold_quantile": args.adaptive_thresholds,
+                "dedupe_layouts": args.dedupe_layouts,
+                "trial_allocation": args.trial_allocation,
+                "router": args.router,
+                "beam_width": args.beam_width,
+                "batch_trials": args.batch_trials}
+
+    tasks = [(filepath, architecture) for architecture in args.architectures for filepath in inputs]
+
+    # Every circuit gets its own seed, so the results don't depend on which worker ran it
+    if args.seed is None:
+        seeds = [None] * len(tasks)
+    else:
+        seeds = np.random.SeedSequence(args.seed).generate_state(len(tasks), dtype=np.uint64).tolist()
+
+    tasks = [(filepath, architecture, seed) for (filepath, architecture), seed in zip(tasks, seeds)]
+
+    # Fork is used where it is available, so the workers share the lattices instead of each
+    # getting their own copy
+    if "fork" in mp.get_all_start_methods():
+        context = mp.get_context("fork")
+    else:
+        context = mp.get_context()
+
+    workers = max(min(args.workers, len(tasks)), 1)
+
+    print(f"Solving {len(tasks)} circuits with {workers} workers\n")
+
+    start_time = time.perf_counter()
+    num_errors = 0
+
+    with open(args.output, "w") as file, context.Pool(workers, initializer=_init_worker, initargs=(lattices, settings)) as pool:
+
+        for i, record in enumerate(pool.imap_unordered(_solve_circuit, tasks)):
+
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+
+            if "error" in record:
+                num_errors += 1
+                print(f"{i + 1}/{len(tasks)} {record['input']} ({record['architecture']}): {record['error']}")
+            else:
+                print(f"{i + 1}/{len(tasks)} {record['input']} ({record['architecture']}): {record['best_swaps']} swaps, depth {record['depth']}")
+
+    run_time = round(time.perf_counter() - start_time, ndigits=2)
+
+    print()
+    print(f"Finished {len(tasks)} circuits in {run_time} seconds, {num_errors} of which could not be solved")
+    print(f"Results written to {args.output}")
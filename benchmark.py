@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+import optimization_funcs as ofs
+from post_processing_funcs import post_process_moves
+from schedule_funcs import calc_depth
+
+"""
+This runs the minimum swap algorithm over a set of input files on each architecture
+ and records how long it took and how good the paths were, so that changes to the
+ algorithm can be checked against each other
+
+ Every run is seeded, so running the same version twice gives the same paths, and
+ only the times change.
+ Trials are never truncated, so the mean swaps are the real swaps of every trial instead of
+ the point where a trial was cut off.
+ The results are written to a JSON file, which can be given back with --compare in a
+ later run to flag anything that got slower or needed more swaps.
+"""
+
+# Inputs are found and named relative to the folder this file is in, so the results of runs
+# from different places can be compared
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The inputs used if none are given
+default_inputs = ["test_circuits/*.qasm", "test_graphs/*.txt"]
+
+# Runs quicker than this, in seconds, are mostly timer noise, so their times aren't compared
+min_compare_time = 0.05
+
+
+parser = argparse.ArgumentParser(
+                    prog='benchmark.py',
+                    description='Runs the minimum swap algorithm over many inputs and records the results')
+
+parser.add_argument('inputs', nargs='*',
+                    help="The .txt or .qasm files to run, which can be glob patterns.\n"
+                    "(default: every file in test_circuits and test_graphs)")
+parser.add_argument('-a', '--architectures', nargs='+', choices=["Hex", "HHex"], default=["Hex", "HHex"],
+                    help="The lattices to run every input on.\n"
+                    "(default: Hex HHex)")
+parser.add_argument('-i', '--iterations', default=100, type=int,
+                    help="The number of attempts to find the minimum swap path for each input.\n"
+                    "(default: 100)")
+parser.add_argument('-s', '--seed', default=0, type=int,
+                    help="The seed every run starts from.\n"
+                    "(default: 0)")
+parser.add_argument('-ps', '--placement_search', choices=["random", "steepest", "tabu"], default="random",
+                    help="How each starting position is improved before it is solved, as in main.py.\n"
+                    "(default: random)")
+parser.add_argument('-dl', '--dedupe_layouts', action='store_true', default=False,
+                    help="If true, starting positions that were already tried, up to the symmetries of the "
+                    "lattice, get fewer trials, as in main.py.\n"
+                    "(default: False)")
+parser.add_argument('-ta', '--trial_allocation', choices=["fixed", "halving"], default="fixed",
+                    help="How the trials are shared out between the starting positions, as in main.py.\n"
+                    "(default: fixed)")
+parser.add_argument('-rt', '--router', choices=["greedy", "beam"], default="greedy",
+                    help="How each trial moves the qubits, as in main.py.\n"
+                    "(default: greedy)")
+parser.add_argument('-bw', '--beam_width', default=8, type=int,
+                    help="The number of partial paths the beam search keeps, as in main.py.\n"
+                    "(default: 8)")
+parser.add_argument('-bt', '--batch_trials', default=None, type=int,
+                    help="If given, every starting position gets this many trials, which are run together as one "
+                    "batch, as in main.py.\n"
+                    "(default: None)")
+parser.add_argument('-obj', '--objective', choices=["swaps", "depth"], default="swaps",
+                    help="Whether to look for the path with the fewest swaps, or the path with the fewest "
+                    "layers of gates and swaps that run at the same time, as in main.py.\n"
+                    "(default: swaps)")
+parser.add_argument('-o', '--output', default="benchmark_results.json",
+                    help="The JSON file the results are written to.\n"
+                    "(default: benchmark_results.json)")
+parser.add_argument('-c', '--compare', default=None,
+                    help="A JSON file from an earlier run. Any input that is slower or needs more swaps "
+                    "than it did in that run is reported, and the program exits with an error.\n"
+                    "(default: None)")
+parser.add_argument('-tt', '--time_tolerance', default=0.25, type=float,
+                    help="How much longer, as a fraction, the time per trial can be than in the compared "
+                    "run before it counts as slower.\n"
+                    "(default: 0.25)")
+parser.add_argument('-st', '--swap_tolerance', default=0, type=int,
+                    help="How many more swaps the best path can need than in the compared run before "
+                    "it counts as worse.\n"
+                    "(default: 0)")
+
+args = parser.parse_args()
+
+
+"""
+Functions for the Benchmark
+"""
+
+
+# This finds every input file
+def find_inputs(patterns):
+
+    if not patterns:
+        patterns = [os.path.join(base_dir, pattern) for pattern in default_inputs]
+
+    inputs = []
+    for pattern in patterns:
+        inputs += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+
+    return inputs
+
+
+# This runs one input on one lattice and returns the record for it
+# Anything that stops the run, including the quit() calls in the algorithm, is recorded
+# as an error instead of ending the whole benchmark
+# settings holds the modes of the search, which are handed straight to iterate_through
+def run_benchmark(filepath, architecture, lattice_Graph, iterations, seed, settings):
+
+    record = {"input": os.path.relpath(filepath, base_dir),
+              "architecture": architecture,
+              "seed": seed,
+              "iterations": iterations}
+
+    output = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(output):
+            QUBO_Graph, num_nodes, num_edges, list_nodes = ofs.make_qubo_graph(filepath)
+            QUBO_Graph = ofs.find_greens(QUBO_Graph)
+
+            start_time = time.perf_counter()
+            best_moves_list, best_moves_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, total_iterations, graph_distance, init_entangles, ave_swap_list, attempts = ofs.iterate_through(lattice_Graph,
+                                                                                                                                                                                                 QUBO_Graph,
+                                                                                                                                                                                                 iterations,
+                                                                                                                                                                                                 True,
+                                                                                                                                                                                                 0.0,
+                                                                                                                                                                                                 10_000,
+                                                                                                                                                                                                 seed=seed,
+                                                                                                                                                                                                 **settings)
+            run_time = time.perf_counter() - start_time
+
+            # Merge swaps into the gates next to them and drop swaps that undo each other
+            best_moves_list, best_moves_key = post_process_moves(lattice_Graph, QUBO_Graph, best_lattice_nodes, best_moves_list, best_moves_key)
+
+    except (Exception, SystemExit) as error:
+        record["error"] = f"{type(error).__name__}: {error}".strip(": ")
+        last_line = output.getvalue().strip().split("\n")[-1]
+        if last_line:
+            record["error"] += f" ({last_line})"
+        return record
+
+    record["num_qubits"] = num_nodes
+    record["num_entangles"] = num_edges
+    record["wall_time"] = run_time
+    record["time_per_trial"] = run_time / max(total_iterations, 1)
+    record["best_swaps"] = best_moves_key.count("s")
+    record["mean_swaps"] = float(np.average(list_of_swap_nums))
+    record["depth"] = calc_depth(best_lattice_nodes, best_moves_list, best_moves_key)
+    record["placement_attempts"] = float(np.average(attempts)) if attempts else 0.0
+
+    return record
+
+
+# This checks the records against the ones from an earlier run
+# It returns a message for every input that got slower or worse
+def compare_records(records, baseline_records, time_tolerance, swap_tolerance):
+
+    baseline = {(record["input"], record["architecture"]): record for record in baseline_records}
+    regressions = []
+
+    for record in records:
+        old_record = baseline.get((record["input"], record["architecture"]))
+
+        if old_record is None:
+            continue
+
+        name = f"{record['input']} on {record['architecture']}"
+
+        if "error" in record and "error" not in old_record:
+            regressions.append(f"{name} failed with {record['error']}")
+            continue
+        if "error" in record or "error" in old_record:
+            continue
+
+        slower = record["time_per_trial"] > old_record["time_per_trial"] * (1 + time_tolerance)
+        if slower and max(record["wall_time"], old_record["wall_time"]) >= min_compare_time:
+            regressions.append(f"{name} is slower: {record['time_per_trial'] * 1000:.3f} ms per trial, "
+                               f"was {old_record['time_per_trial'] * 1000:.3f} ms")
+
+        if record["best_swaps"] > old_record["best_swaps"] + swap_tolerance:
+            regressions.append(f"{name} needs more swaps: {record['best_swaps']}, was {old_record['best_swaps']}")
+
+    return regressions
+
+
+"""
+Running the Benchmark
+"""
+
+inputs = find_inputs(args.inputs)
+records = []
+
+settings = {"placement_search": args.placement_search,
+            "dedupe_layouts": args.dedupe_layouts,
+            "trial_allocation": args.trial_allocation,
+            "router": args.router,
+            "beam_width": args.beam_width,
+            "batch_trials": args.batch_trials,
+            "objective": args.objective}
+
+print(f"Running {len(inputs)} inputs on {', '.join(args.architectures)} with {args.iterations} iterations each\n")
+
+for architecture in args.architectures:
+
+    # The lattice is the same for every input, so it is only made once
+    lattice_Graph = ofs.import_lattice(architecture)
+
+    for filepath in inputs:
+        record = run_benchmark(filepath, architecture, lattice_Graph, args.iterations, args.seed, settings)
+        records.append(record)
+
+        if "error" in record:
+            print(f"{record['input']} ({architecture}): {record['error']}")
+        else:
+            print(f"{record['input']} ({architecture}): {record['best_swaps']} swaps, depth {record['depth']}, "
+                  f"{record['mean_swaps']:.2f} on average, {record['wall_time']:.2f} s")
+
+with open(args.output, "w") as file:
+    json.dump({"iterations": args.iterations, "seed": args.seed, "settings": settings, "results": records}, file, indent=1)
+
+print()
+print(f"Results written to {args.output}")
+
+if args.compare is not None:
+
+    with open(args.compare) as file:
+        baseline = json.load(file)
+
+    baseline_records = baseline["results"]
+
+    if baseline.get("settings") != settings:
+        print()
+        print(f"The search modes are not the same as in {args.compare}, so the results may not be comparable")
+
+    regressions = compare_records(records, baseline_records, args.time_tolerance, args.swap_tolerance)
+
+    print()
+    if regressions:
+        print(f"{len(regressions)} regressions compared to {args.compare}:")
+        for regression in regressions:
+            print(f"    {regression}")
+        quit(1)
+    else:
+        print(f"No regressions compared to {args.compare}")
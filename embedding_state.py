@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from array import array
+
+import numpy as np
+
+"""
+Compact state of a QUBO embedded on the lattice
+
+The heuristic hot paths only ever need to know which qubit sits on which lattice site,
+where each qubit is and which entanglements are still left to do, so instead of going
+through the networkx node attribute dictionaries ('qubit' on the lattice and 'embedded'
+on the QUBO graph) and a list of entangles, the state is kept in flat arrays that are
+always updated together.
+The networkx graphs are only rebuilt from these arrays at the end, for plotting.
+"""
+
+
+class EmbeddingState:
+
+    def __init__(self, num_sites, num_qubits, entangles):
+
+        # qubit_at_site[site] is the QUBO qubit on that lattice site, or -1 if it is empty
+        # site_of_qubit[qubit] is the lattice site the QUBO qubit is embedded at, or -1
+        # QUBO qubits are indexed by their label, so labels that never show up in the
+        # QUBO graph just keep a -1
+        self.qubit_at_site = array('h', [-1]) * num_sites
+        self.site_of_qubit = array('h', [-1]) * num_qubits
+
+        # Every entangle gets an id, which is its index in this list
+        # These never change, so they are shared between copies of the state
+        self.entangles = [tuple(entangle) for entangle in entangles]
+
+        # partners[qubit] lists (partner, entangle id) for every entangle of that qubit,
+        # so the entangles of a qubit can be found without going through all of them
+        self.partners = [[] for qubit in range(num_qubits)]
+
+        for entangle_id, (qubit1, qubit2) in enumerate(self.entangles):
+            self.partners[qubit1].append((qubit2, entangle_id))
+            self.partners[qubit2].append((qubit1, entangle_id))
+
+        # The same entangles as an (entangles x 2) array, for the vectorized calculations
+        self.entangle_array = np.array(self.entangles, dtype=np.intp).reshape(-1, 2)
+
+        # pending[entangle id] is 1 while that entangle still needs to be done
+        self.pending = bytearray([1]) * len(self.entangles)
+        self.num_pending = len(self.entangles)
+
+        # num_pending_of[qubit] is how many of the pending entangles that qubit is in
+        self.num_pending_of = array('h', [len(qubit_partners) for qubit_partners in self.partners])
+
+        # The distance function of the graph, which is the sum of the lattice distances of the
+        # entangles still left to do
+        # It is set once the qubits are placed and then kept up to date by whatever moves them
+        self.total_distance = 0
+
+    # Makes an empty state that fits the given lattice and QUBO graphs
+    @classmethod
+    def for_graphs(cls, lattice_Graph, QUBO_Graph):
+
+        return cls(lattice_Graph.number_of_nodes(), max(QUBO_Graph.nodes) + 1, QUBO_Graph.edges)
+
+    # Puts a qubit onto an empty lattice site
+    def place(self, site, qubit):
+
+        self.qubit_at_site[site] = qubit
+        self.site_of_qubit[qubit] = site
+
+    # Swaps whatever is on the two lattice sites, which may include an empty site
+    def swap(self, site1, site2):
+
+        qubit_at_site = self.qubit_at_site
+
+        qubit1 = qubit_at_site[site1]
+        qubit2 = qubit_at_site[site2]
+
+        qubit_at_site[site1] = qubit2
+        qubit_at_site[site2] = qubit1
+
+        if qubit1 != -1:
+            self.site_of_qubit[qubit1] = site2
+        if qubit2 != -1:
+            self.site_of_qubit[qubit2] = site1
+
+    def is_placed(self, qubit):
+
+        return self.site_of_qubit[qubit] != -1
+
+    # Marks an entangle as done
+    def complete_entangle(self, entangle_id):
+
+        self.pending[entangle_id] = 0
+        self.num_pending -= 1
+
+        qubit1, qubit2 = self.entangles[entangle_id]
+        self.num_pending_of[qubit1] -= 1
+        self.num_pending_of[qubit2] -= 1
+
+    # Zero copy numpy views of the state, for the vectorized calculations
+    def site_of_qubit_view(self):
+
+        return np.frombuffer(self.site_of_qubit, dtype=np.int16)
+
+    def pending_mask(self):
+
+        return np.frombuffer(self.pending, dtype=np.bool_)
+
+    # Returns the ids of the entangles that still need to be done
+    def pending_entangles(self):
+
+        pending = self.pending
+
+        return [entangle_id for entangle_id in range(len(pending)) if pending[entangle_id]]
+
+    def copy(self):
+
+        new_state = EmbeddingState.__new__(EmbeddingState)
+        new_state.qubit_at_site = array('h', self.qubit_at_site)
+        new_state.site_of_qubit = array('h', self.site_of_qubit)
+
+        new_state.entangles = self.entangles
+        new_state.partners = self.partners
+        new_state.entangle_array = self.entangle_array
+
+        new_state.pending = bytearray(self.pending)
+        new_state.num_pending = self.num_pending
+        new_state.num_pending_of = array('h', self.num_pending_of)
+        new_state.total_distance = self.total_distance
+
+        return new_state
+
+    # Copies the placement and pending entangles of another state of the same graphs into this one
+    # The arrays are copied straight into the ones this state already has, so a state can be reset
+    # to a saved one over and over without making anything new
+    def restore(self, other):
+
+        self.qubit_at_site[:] = other.qubit_at_site
+        self.site_of_qubit[:] = other.site_of_qubit
+
+        self.pending[:] = other.pending
+        self.num_pending = other.num_pending
+        self.num_pending_of[:] = other.num_pending_of
+        self.total_distance = other.total_distance
+
+    # These give the state in the form used by reconstruct_lattice and reconstruct_qubo
+    def lattice_nodes(self):
+
+        return self.qubit_at_site.tolist()
+
+    def qubo_embeds(self):
+
+        return self.site_of_qubit.tolist()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import math
+
+import numpy as np
+
+from lattice_tables import LatticeTables, calc_tables
+
+"""
+Generated heavy hex and hex lattices of any size
+
+The lattices in lattice_graphs only have about 50 sites, so these build bigger ones the
+same way IBM lays out its devices. A heavy hex lattice is made of rows of qubits joined
+by single bridge qubits every fourth column, and a hex lattice is a brick wall of rows
+joined every second column.
+
+Both come in a family of sizes numbered by k. For heavy hex, k = 3, 6 and 10 give the
+127, 433 and 1121 qubit layouts of the Eagle, Osprey and Condor devices.
+
+The sites are numbered along a spiral out from the center of the lattice, like the
+lattice files are, because the initial placement puts the qubits down in site order.
+"""
+
+
+"""
+Building the Lattices
+"""
+
+
+# This builds a heavy hex lattice with the given number of rows, where the rows have width
+# qubits, except the middle rows which have one more
+# It returns the (x, y) position of every site and the list of edges
+def heavy_hex_lattice(rows, width):
+
+    positions = []
+    edges = []
+
+    # site_at[(row, col)] is the site of the qubit in that row and column
+    site_at = {}
+
+    for row in range(rows):
+
+        # The first row leaves off the last column, and the last row leaves off whichever end
+        # has no bridge going up to it
+        if row == 0:
+            cols = range(0, width)
+        elif row < rows - 1:
+            cols = range(0, width + 1)
+        elif (row - 1) % 2 == 0:
+            cols = range(0, width)
+        else:
+            cols = range(1, width + 1)
+
+        for col in cols:
+            site_at[(row, col)] = len(positions)
+            positions.append((col, -2 * row))
+
+            if (row, col - 1) in site_at:
+                edges.append((site_at[(row, col - 1)], site_at[(row, col)]))
+
+    # The bridges between neighboring rows alternate between starting at column 0 and column 2
+    for row in range(rows - 1):
+        for col in range(0 if row % 2 == 0 else 2, width + 1, 4):
+
+            if (row, col) in site_at and (row + 1, col) in site_at:
+                bridge = len(positions)
+                positions.append((col, -2 * row - 1))
+
+                edges.append((site_at[(row, col)], bridge))
+                edges.append((bridge, site_at[(row + 1, col)]))
+
+    return positions, edges
+
+
+# This builds a hex lattice with the given number of rows of width qubits each
+# Neighboring rows are joined every second column, alternating between rows, which makes
+# every face of the lattice a hexagon
+def hex_lattice(rows, width):
+
+    positions = []
+    edges = []
+
+    for row in range(rows):
+        for col in range(width):
+            site = row * width + col
+            positions.append((col, -row))
+
+            if col > 0:
+                edges.append((site - 1, site))
+            if row > 0 and (col + row) % 2 == 1:
+                edges.append((site - width, site))
+
+    return positions, edges
+
+
+# The rows and width of lattice k in the family of each architecture
+def lattice_shape(lattice_geo, k):
+
+    if lattice_geo == "HHex":
+        return 2 * k + 1, 4 * k + 2
+    if lattice_geo == "Hex":
+        return k, 2 * k
+
+
+def build_lattice(lattice_geo, k):
+
+    rows, width = lattice_shape(lattice_geo, k)
+
+    if lattice_geo == "HHex":
+        return heavy_hex_lattice(rows, width)
+    if lattice_geo == "Hex":
+        return hex_lattice(rows, width)
+
+
+# The number of sites in lattice k of the family
+def lattice_num_sites(lattice_geo, k):
+
+    rows, width = lattice_shape(lattice_geo, k)
+
+    if lattice_geo == "HHex":
+        # Two short rows, the longer middle rows and k + 1 bridges between each pair of rows
+        return 2 * width + (rows - 2) * (width + 1) + (rows - 1) * (k + 1)
+    if lattice_geo == "Hex":
+        return rows * width
+
+
+# This returns the k of the smallest lattice in the family with at least num_qubits sites
+def smallest_lattice_size(lattice_geo, num_qubits):
+
+    k = 1
+    while lattice_num_sites(lattice_geo, k) < num_qubits:
+        k += 1
+
+    return k
+
+
+"""
+Numbering the Sites
+"""
+
+
+# This finds the order the sites are placed in, which is a spiral out from the site closest
+# to the middle of the lattice
+# The rings are the sites at each distance from the center. From each site, the spiral steps to
+# an unplaced neighbor in the innermost unfinished ring or the one after it, closest to the center
+# first and then going counterclockwise. When there is no such neighbor, it jumps to the nearest
+# unplaced site of the innermost unfinished ring
+def spiral_order(positions, edges):
+
+    positions = np.array(positions, dtype=float)
+    num_sites = len(positions)
+
+    center = int(np.argmin(((positions - positions.mean(axis=0)) ** 2).sum(axis=1)))
+    dist = calc_tables(num_sites, np.array(edges).reshape(-1, 2))[0].tolist()
+    rings = dist[center]
+
+    offsets = positions - positions[center]
+    angles = np.arctan2(offsets[:, 1], offsets[:, 0]).tolist()
+
+    neighbors = [[] for site in range(num_sites)]
+    for site1, site2 in edges:
+        neighbors[site1].append(site2)
+        neighbors[site2].append(site1)
+
+    # How many sites of each ring are still unplaced
+    unplaced_in_ring = [0] * (max(rings) + 1)
+    for ring in rings:
+        unplaced_in_ring[ring] += 1
+
+    order = [center]
+    placed = [False] * num_sites
+    placed[center] = True
+    unplaced_in_ring[0] -= 1
+    inner_ring = 0
+    site = center
+
+    for i in range(num_sites - 1):
+
+        while not unplaced_in_ring[inner_ring]:
+            inner_ring += 1
+
+        angle = angles[site]
+        site_dist = dist[site]
+
+        cand_sites = [next_site for next_site in neighbors[site] if not placed[next_site] and rings[next_site] <= inner_ring + 1]
+        if cand_sites:
+            # How far counterclockwise a site is from the current one breaks ties
+            site = min(cand_sites, key=lambda next_site: (rings[next_site], (angles[next_site] - angle) % (2 * math.pi)))
+        else:
+            cand_sites = [next_site for next_site in range(num_sites) if not placed[next_site] and rings[next_site] == inner_ring]
+            site = min(cand_sites, key=lambda next_site: (site_dist[next_site], (angles[next_site] - angle) % (2 * math.pi)))
+
+        order.append(site)
+        placed[site] = True
+        unplaced_in_ring[rings[site]] -= 1
+
+    return order
+
+
+# This renumbers the sites in the given order and scales the positions to fit in a unit square,
+# the same as the lattice files
+def renumber_sites(positions, edges, order):
+
+    new_site = [0] * len(order)
+    for i, site in enumerate(order):
+        new_site[site] = i
+
+    positions = np.array(positions, dtype=float)[order]
+    positions -= positions.min(axis=0)
+    positions /= max(positions.max(), 1)
+
+    edges = sorted((min(new_site[site1], new_site[site2]), max(new_site[site1], new_site[site2])) for site1, site2 in edges)
+
+    return positions, np.array(edges, dtype=np.int16).reshape(-1, 2)
+
+
+"""
+Loading the Lattices
+"""
+
+
+# This makes all of the arrays for lattice k of the family, numbered along the spiral
+def compile_generated_lattice(lattice_geo, k):
+
+    positions, edges = build_lattice(lattice_geo, k)
+    positions, edges = renumber_sites(positions, edges, spiral_order(positions, edges))
+
+    dist, next_hop = calc_tables(len(positions), edges)
+
+    return {"positions": positions, "edges": edges, "dist": dist, "next_hop": next_hop}
+
+
+# This loads the tables for lattice k of the family, from the cache if it has been made before
+def load_generated_tables(lattice_geo, k, cache_dir=None):
+
+    lattice_tables = LatticeTables.from_cache(f"{lattice_geo}_k{k}",
+                                              cache_dir,
+                                              lambda: compile_generated_lattice(lattice_geo, k))
+    lattice_tables.source = (load_generated_tables, (lattice_geo, k, cache_dir))
+
+    return lattice_tables
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from collections import deque
+import hashlib
+import os
+
+import numpy as np
+
+"""
+Precomputed routing tables for a qubit lattice
+
+The lattice never changes while solving, so the distance between every pair of sites
+and the first step of a shortest path between them are worked out once per lattice.
+Finding a path between two qubits is then just a walk along next_hop instead of a
+graph search.
+
+The tables for a lattice can also be saved to a cache folder as .npy files, named by a hash
+of its node and edge files, or by its size for generated lattices. Later runs, and every worker
+process, then memory map the saved arrays read only instead of parsing the files and
+searching the lattice again, so they all share the same pages.
+The hot paths index the tables one element at a time, which is slow on numpy arrays, so they
+go through a memoryview of each row instead. Indexing a memoryview gives a plain int almost as
+quickly as a list, and the rows stay in the shared pages instead of being copied into every
+process.
+"""
+
+# Bump this if what is saved in the cache changes, so old cache files are not used
+cache_version = 1
+
+# The arrays saved for each lattice
+cache_arrays = ("positions", "edges", "dist", "next_hop")
+
+
+class LatticeTables:
+
+    def __init__(self, lattice_Graph):
+
+        edges = np.array(list(lattice_Graph.edges), dtype=np.int16).reshape(-1, 2)
+        dist, next_hop = calc_tables(lattice_Graph.number_of_nodes(), edges)
+
+        self._set_tables(None, edges, dist, next_hop)
+
+    # Fills in everything from the arrays, which are either worked out or loaded from the cache
+    # positions is the (x, y) drawing position of each site, if it is known
+    def _set_tables(self, positions, edges, dist, next_hop):
+
+        num_sites = len(dist)
+
+        self.num_sites = num_sites
+        self.positions = positions
+        self.edges = [tuple(edge) for edge in edges.tolist()]
+
+        self.neighbors = [[] for site in range(num_sites)]
+        for site1, site2 in self.edges:
+            self.neighbors[site1].append(site2)
+            self.neighbors[site2].append(site1)
+        for site_neighbors in self.neighbors:
+            site_neighbors.sort()
+
+        # dist[a][b] is the number of edges on a shortest path between sites a and b
+        # next_hop[a][b] is the site to step to from a to get one closer to b
+        # The arrays are used for anything vectorized, while the hot paths index the rows
+        self.dist = dist
+        self.next_hop = next_hop
+
+        self.dist_rows = calc_rows(dist)
+        self.next_hop_rows = calc_rows(next_hop)
+
+        # The function and arguments that load these tables again, if they came from the cache
+        self.source = None
+
+        # The symmetries of the lattice, which are only worked out if they are needed
+        self._automorphisms = None
+
+    # Loads the tables saved in the cache under the given key, or makes them with compile_arrays
+    # and saves them there if they aren't there yet
+    # The saved tables are memory mapped. With no cache folder, they are just made
+    @classmethod
+    def from_cache(cls, cache_key, cache_dir, compile_arrays):
+
+        lattice_tables = cls.__new__(cls)
+
+        cache_files = None
+        if cache_dir is not None:
+            cache_files = {name: os.path.join(cache_dir, f"{cache_key}_v{cache_version}_{name}.npy") for name in cache_arrays}
+
+        if cache_files is not None and all(os.path.exists(file) for file in cache_files.values()):
+            arrays = {name: np.load(file, mmap_mode='r') for name, file in cache_files.items()}
+        else:
+            arrays = compile_arrays()
+
+            if cache_files is not None:
+                save_cache(cache_dir, cache_files, arrays)
+
+        lattice_tables._set_tables(arrays["positions"], arrays["edges"], arrays["dist"], arrays["next_hop"])
+
+        return lattice_tables
+
+    # Loads the tables for the lattice in the given node and edge files
+    @classmethod
+    def load(cls, nodes_filepath, edges_filepath, cache_dir=None):
+
+        lattice_tables = cls.from_cache(calc_cache_key(nodes_filepath, edges_filepath),
+                                        cache_dir,
+                                        lambda: compile_lattice(nodes_filepath, edges_filepath))
+        lattice_tables.source = (LatticeTables.load, (nodes_filepath, edges_filepath, cache_dir))
+
+        return lattice_tables
+
+    # Tables that came from the cache are sent to other processes as just the way to load them,
+    # so the other process memory maps the same cache instead of getting a copy of every array
+    def __reduce_ex__(self, protocol):
+
+        if self.source is not None:
+            return self.source
+
+        return super().__reduce_ex__(protocol)
+
+    # Memoryviews can't be pickled, so the rows are left out and made again from the arrays
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        del state["dist_rows"], state["next_hop_rows"]
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+
+        self.dist_rows = calc_rows(self.dist)
+        self.next_hop_rows = calc_rows(self.next_hop)
+
+    # Returns the automorphisms of the lattice, which are the ways of moving every site to another
+    # that keep the same edges, like rotations and reflections
+    # Each row is one of them, with the site every site is moved to
+    def automorphisms(self):
+
+        if self._automorphisms is None:
+            self._automorphisms = calc_automorphisms(np.asarray(self.dist), np.array(self.edges, dtype=np.intp).reshape(-1, 2))
+
+        return self._automorphisms
+
+    # Returns a shortest path between the two sites, including both ends
+    def path(self, start, end):
+
+        next_hop = self.next_hop_rows
+
+        path = [start]
+        while start != end:
+            start = next_hop[start][end]
+            path.append(start)
+
+        return path
+
+
+# This works out the distance and next hop tables of a lattice from its list of edges
+def calc_tables(num_sites, edges):
+
+    neighbors = [[] for site in range(num_sites)]
+    for site1, site2 in edges.tolist():
+        neighbors[site1].append(site2)
+        neighbors[site2].append(site1)
+    for site_neighbors in neighbors:
+        site_neighbors.sort()
+
+    # A breadth first search out from each target site fills in one column of each table,
+    # because the site a node was discovered from is one step closer to the target
+    dist_cols = []
+    next_hop_cols = []
+
+    for target in range(num_sites):
+
+        dist_col = [-1] * num_sites
+        next_hop_col = [-1] * num_sites
+
+        dist_col[target] = 0
+        next_hop_col[target] = target
+
+        queue = deque([target])
+
+        while queue:
+            site = queue.popleft()
+
+            for next_site in neighbors[site]:
+                if dist_col[next_site] == -1:
+                    dist_col[next_site] = dist_col[site] + 1
+                    next_hop_col[next_site] = site
+                    queue.append(next_site)
+
+        dist_cols.append(dist_col)
+        next_hop_cols.append(next_hop_col)
+
+    dist = np.array(dist_cols, dtype=np.int16).T.copy()
+    next_hop = np.array(next_hop_cols, dtype=np.int16).T.copy()
+
+    return dist, next_hop
+
+
+# This gives a memoryview of each row of a table, which reads from the same memory as the array
+def calc_rows(table):
+
+    return [memoryview(row) for row in np.ascontiguousarray(table)]
+
+
+# This finds every automorphism of the lattice from its distance table
+# An automorphism keeps the distance between every pair of sites the same. If every site has a
+# different list of distances to a few base sites, then where those base sites go decides where
+# every other site goes, so only the places the base sites can go have to be searched
+def calc_automorphisms(dist, edges):
+
+    num_sites = len(dist)
+
+    # A site can only go to a site with the same distances to everything else, in some order
+    _, profile_class = np.unique(np.sort(dist, axis=1), axis=0, return_inverse=True)
+    profile_class = profile_class.reshape(-1)
+
+    # Base sites are added one at a time, picking whichever tells the most sites apart, with
+    # sites that have the fewest others like them breaking ties
+    # keys numbers the sites by their distances to the base sites so far, so that two sites have
+    # the same key until a base site tells them apart
+    class_sizes = np.bincount(profile_class)
+    radix = int(dist.max()) + 1
+    keys = np.zeros(num_sites, dtype=np.int64)
+    base = []
+
+    while len(np.unique(keys)) < num_sites:
+        cand_keys = np.sort(keys[:, None] * radix + dist, axis=0)
+        num_told_apart = (1 + (np.diff(cand_keys, axis=0) != 0).sum(axis=0)).tolist()
+
+        site = max(range(num_sites), key=lambda site: (num_told_apart[site], -class_sizes[profile_class[site]]))
+        base.append(site)
+
+        keys = np.unique(keys * radix + dist[:, site], return_inverse=True)[1].reshape(-1)
+
+    base_dists = dist[:, base]
+    base_keys = [row.tobytes() for row in base_dists]
+
+    automorphisms = []
+
+    # This tries every place the base sites can go, keeping the distances between them the same
+    def place_base(images):
+
+        i = len(images)
+
+        if i == len(base):
+            image_keys = {row.tobytes(): site for site, row in enumerate(dist[:, images])}
+            automorphism = [image_keys.get(key, -1) for key in base_keys]
+
+            # Every site has to go somewhere different, and every edge has to stay an edge
+            if -1 not in automorphism and len(set(automorphism)) == num_sites:
+                automorphism = np.array(automorphism, dtype=np.intp)
+                if (dist[automorphism[edges[:, 0]], automorphism[edges[:, 1]]] == 1).all():
+                    automorphisms.append(automorphism)
+            return
+
+        cand_sites = np.flatnonzero(profile_class == profile_class[base[i]])
+        for j, image in enumerate(images):
+            cand_sites = cand_sites[dist[cand_sites, image] == dist[base[i], base[j]]]
+
+        for site in cand_sites.tolist():
+            place_base(images + [site])
+
+    place_base([])
+
+    return np.array(automorphisms, dtype=np.intp).reshape(-1, num_sites)
+
+
+# This reads the rows of a lattice file, which has a comment line and a header line before the data
+# Lines with only whitespace on them are skipped
+def read_lattice_file(filepath, dtype):
+
+    with open(filepath) as file:
+        rows = [line.split(",") for line in file.readlines()[2:] if line.strip()]
+
+    return np.array(rows, dtype=float).astype(dtype).reshape(-1, 2)
+
+
+# This reads a node file and an edge file and works out all of the tables for that lattice
+def compile_lattice(nodes_filepath, edges_filepath):
+
+    positions = read_lattice_file(nodes_filepath, np.float64)
+    edges = read_lattice_file(edges_filepath, np.int16)
+
+    dist, next_hop = calc_tables(len(positions), edges)
+
+    return {"positions": positions, "edges": edges, "dist": dist, "next_hop": next_hop}
+
+
+# The cache files are named by a hash of the lattice files, so editing either file makes new ones
+def calc_cache_key(nodes_filepath, edges_filepath):
+
+    file_hash = hashlib.sha1()
+
+    for filepath in (nodes_filepath, edges_filepath):
+        with open(filepath, "rb") as file:
+            file_hash.update(file.read())
+
+    return file_hash.hexdigest()[:16]
+
+
+# This saves the arrays to the cache
+# Each file is written under a temporary name and then renamed, so a process that is loading the
+# cache at the same time never sees half of a file
+# If the cache can't be written to, the tables just get worked out again next time
+def save_cache(cache_dir, cache_files, arrays):
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        for name, file in cache_files.items():
+            temp_file = f"{file}.{os.getpid()}.tmp"
+            with open(temp_file, "wb") as temp:
+                np.save(temp, arrays[name])
+            os.replace(temp_file, file)
+
+    except OSError:
+        pass
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+"""
+Cache of the starting positions that have already been solved
+
+The random placement and the distance adjustments often end up at a starting position
+that has already been tried, or at a rotation or reflection of one, which solves exactly
+the same way. Every starting position is turned into a canonical form, which is the
+smallest of its copies under all of the automorphisms of the lattice, so all of the copies
+of a position have the same key.
+
+The cache records how many times each position was picked and the best and average swaps
+of its trials. A position that comes up again gets half as many trials as it did the time
+before, down to one, so the trials go to new positions instead. When the swaps of its earlier
+trials are known, they decide instead:
+    a position that didn't reach the best path so far, or that does worse on average than
+    the positions tried so far, only gets one trial
+    a position that found the best path so far, and does at least as well as the average,
+    gets twice as many trials as the halving would give it
+The least recently seen positions are dropped once the cache is full.
+"""
+
+
+class LayoutCache:
+
+    def __init__(self, automorphisms, max_layouts=10_000):
+
+        self.automorphisms = automorphisms
+        self.max_layouts = max_layouts
+
+        # Maps the key of a position to [times picked, trials, best swaps, total swaps]
+        self.layouts = OrderedDict()
+
+        self.num_repeats = 0
+
+        # The trials and total swaps of every position, for the average over all of them
+        self.num_trials = 0
+        self.total_swaps = 0
+
+    # Returns the key of the position, given the qubit on each site
+    def key(self, qubit_at_site):
+
+        qubit_at_site = np.asarray(qubit_at_site, dtype=np.int16)
+        automorphisms = self.automorphisms
+
+        # Every copy puts the qubit on site s onto the site automorphism[s]
+        copies = np.empty((len(automorphisms), len(qubit_at_site)), dtype=np.int16)
+        copies[np.arange(len(automorphisms))[:, None], automorphisms] = qubit_at_site
+
+        return min(copy.tobytes() for copy in copies)
+
+    # Records that a position was picked, and returns how many trials to run on it
+    # best_swap_num is the fewest swaps found so far, or None to go only by the times picked
+    def trial_budget(self, key, num_trials, best_swap_num=None):
+
+        record = self.layouts.get(key)
+
+        if record is None:
+            self.layouts[key] = [1, 0, None, 0]
+
+            if len(self.layouts) > self.max_layouts:
+                self.layouts.popitem(last=False)
+
+            return num_trials
+
+        self.layouts.move_to_end(key)
+        self.num_repeats += 1
+
+        times_picked = record[0]
+        record[0] += 1
+
+        budget = max(num_trials >> times_picked, 1)
+        stats = self.swap_stats(key)
+
+        if stats is None or best_swap_num is None:
+            return budget
+
+        best_swaps, ave_swaps = stats
+
+        if best_swaps > best_swap_num or ave_swaps > self.total_swaps / self.num_trials:
+            return 1
+
+        return min(2 * budget, num_trials)
+
+    # Records the swaps of the trials run on a position
+    def add_trials(self, key, swap_nums):
+
+        record = self.layouts.get(key)
+
+        if record is None or not swap_nums:
+            return
+
+        record[1] += len(swap_nums)
+        record[2] = min(swap_nums) if record[2] is None else min(record[2], min(swap_nums))
+        record[3] += sum(swap_nums)
+
+        self.num_trials += len(swap_nums)
+        self.total_swaps += sum(swap_nums)
+
+    # Returns the best and average swaps of the trials on a position, or None if it isn't there
+    def swap_stats(self, key):
+
+        record = self.layouts.get(key)
+
+        if record is None or not record[1]:
+            return None
+
+        return record[2], record[3] / record[1]
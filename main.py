@@ -7,11 +7,16 @@ Created on Sat Jun  17
 """
 
 import argparse
+import multiprocessing as mp
 import numpy as np
+import signal
 import time
 
-import plotting_functions as gui_func
 import optimization_funcs as ofs
+from post_processing_funcs import post_process_moves
+from schedule_funcs import calc_depth, schedule_moves
+
+# plotting_functions is only imported if there are plots to show, because matplotlib is slow to import
 
 """
 This is the code that will run the minimum swap algorithm a sufficient number of times
@@ -23,10 +28,6 @@ This is the code that will run the minimum swap algorithm a sufficient number of
         it does reduce the number of bad graphs per good graph from 26 to 10, which is a success.
         The next step will be to have it get better at reducing the distance. One way to do this
         might be to have it be able to move qubits to a different spot, instead of just swapping them.
-    Make the code run in parallel
-    Have the computer dynamically adjust the initial condition settings
-    After producing a final solution, go back and find if there are any swaps between qubits that
-        previously went through a gate together without a free swap.
 """
 """
 Arguments: 
@@ -55,11 +56,22 @@ parser.add_argument('-a', '--architecture', choices=["Hex", "HHex"], default="HH
                     help="The physical structure of the qubit connections in the quantum computer. \n"
                     "Either \'Hex\' for hexagonal or \'HHex\' for a heavy hexagonal structure. \n"
                     "(default: HHex)")
+parser.add_argument('-ls', '--lattice_size', default=None,
+                    help="If given, a lattice of the chosen architecture with at least this many qubits is "
+                    "generated instead of using the lattice files. For heavy hex, 127, 433 and 1121 give the "
+                    "layouts of IBM's Eagle, Osprey and Condor devices. Use 'auto' for the smallest lattice "
+                    "that fits the variable graph.\n"
+                    "(default: None)")
 
 # Optimization arguments
-parser.add_argument('-i', '--iterations', default=1_000, type=int,
+parser.add_argument('-i', '--iterations', default=None, type=int,
                     help="The number of attempts to find the minimum swap path.\n"
-                    "(default: 1_000)")
+                    "(default: 1_000, or no limit with a time limit)")
+parser.add_argument('-tl', '--time_limit', default=None, type=float,
+                    help="The number of seconds to search for. The best path found by then is shown, and "
+                    "the search also stops at the number of iterations if one is given. Ctrl+C stops the "
+                    "search early in the same way, with or without a time limit. \n"
+                    "(default: None)")
 parser.add_argument('-ef', '--init_entangles_frac', default=0.0, type=float,
                     help="When a candidate starting position is generated, a minimum "
                     "fraction of qubit pairs must be able to be entangled without using any "
@@ -72,15 +84,68 @@ parser.add_argument('-gd', '--init_graph_dist', default=10_000, type=float,
                     "the value of this argument to be accepted. If the candidate position has a distance "
                     "function greater than this value, a new candidate starting position is generated.\n"
                     "(default: 10_000)")
+parser.add_argument('-at', '--adaptive_thresholds', nargs='?', const=0.5, default=None, type=float,
+                    help="If given, the -ef and -gd thresholds only set where the thresholds start, and they then "
+                    "move on their own to let about this fraction of the starting positions through, for as long "
+                    "as they make the paths better. On its own, the fraction is 0.5. \n"
+                    "(default: None)")
+parser.add_argument('-dl', '--dedupe_layouts', action='store_true', default=False,
+                    help="If true, a starting position that is the same as one already tried, or a rotation or "
+                    "reflection of one, gets half as many trials as it did the last time, down to one. If it never reached "
+                    "the best path so far, or did worse than average, it gets one trial, and if it found the best path "
+                    "it gets twice as many. \n"
+                    "(default: False)")
+parser.add_argument('-ta', '--trial_allocation', choices=["fixed", "halving"], default="fixed",
+                    help="How the trials are shared out between the starting positions. 'fixed' gives every starting "
+                    "position the same number of trials, and 'halving' gives a pool of 8 positions one trial each, "
+                    "then gives the better half of them twice as many trials as the last round, until only the best "
+                    "position is left. \n"
+                    "(default: fixed)")
+parser.add_argument('-rt', '--router', choices=["greedy", "beam"], default="greedy",
+                    help="How each trial moves the qubits. 'greedy' routes one of the closest pending entangles, picked at "
+                    "random, at a time, and 'beam' runs a beam search that tries all of them and keeps the best few partial "
+                    "paths. A beam search trial is much slower, but it gives better paths, so far fewer trials are needed. \n"
+                    "(default: greedy)")
+parser.add_argument('-bw', '--beam_width', default=8, type=int,
+                    help="The number of partial paths the beam search keeps. \n"
+                    "(default: 8)")
+parser.add_argument('-bt', '--batch_trials', default=None, type=int,
+                    help="If given, every starting position gets this many trials, which are run together as one batch "
+                    "with numpy instead of one at a time. A batch of a hundred or more trials runs several times faster "
+                    "per trial, but fewer starting positions are tried for the same number of iterations. Only used "
+                    "with the greedy router. \n"
+                    "(default: None)")
 parser.add_argument('-nt', '--no_truncate', action='store_true', default=False,
                     help="If false, will stop solving the graph once the number of swaps in that solution."
                     "meets or exceeds the current minimum number of swaps. \n"
                     "(default: False)")
+parser.add_argument('-ps', '--placement_search', choices=["random", "steepest", "tabu"], default="random",
+                    help="How each starting position is improved before it is solved. 'random' swaps random pairs "
+                    "of qubits until 50 in a row don't lower the distance function, and 'steepest' always does the "
+                    "swap that lowers it the most until none of them do. 'tabu' runs a tabu search that can also move "
+                    "qubits onto empty sites, which is slower but gives much better starting positions. \n"
+                    "(default: random)")
+parser.add_argument('-obj', '--objective', choices=["swaps", "depth"], default="swaps",
+                    help="Whether to look for the path with the fewest swaps, or the path with the fewest "
+                    "layers of gates and swaps that run at the same time, with the fewest swaps breaking ties. "
+                    "Trials aren't truncated when looking for the fewest layers. \n"
+                    "(default: swaps)")
+parser.add_argument('-w', '--workers', default=1, type=int,
+                    help="The number of processes to split the iterations between. Each process tries its "
+                    "own starting positions, and they share the current minimum number of swaps.\n"
+                    "(default: 1)")
 
 # Data analysis arguments
 parser.add_argument('-v', '--verbose', action='store_true', default=False, 
                     help="If true, will display all graphs generated during the optimization process. \n"
                     "(default: False)")
+parser.add_argument('-np', '--no_plot', action='store_true', default=False,
+                    help="If true, no graphs are displayed, and matplotlib is never imported. \n"
+                    "(default: False)")
+parser.add_argument('-nw', '--no_wait', action='store_true', default=False,
+                    help="If true, the program ends once the solution is printed, instead of waiting for Enter "
+                    "to be pressed. \n"
+                    "(default: False)")
 
 args = parser.parse_args()
 
@@ -112,7 +177,18 @@ print("Creating lattice graph...")
 # Graph info
 # qubit: the number of the node of the QUBO graph that has been
 #        placed at that node
-lattice_Graph = ofs.import_lattice(args.architecture)
+if args.lattice_size is None:
+    lattice_Graph = ofs.import_lattice(args.architecture)
+elif args.lattice_size == "auto":
+    lattice_Graph = ofs.import_lattice(args.architecture, num_nodes)
+else:
+    lattice_Graph = ofs.import_lattice(args.architecture, int(args.lattice_size))
+
+if lattice_Graph.number_of_nodes() < num_nodes:
+    print(f"The lattice only has {lattice_Graph.number_of_nodes()} qubits, which is not enough for the "
+          f"{num_nodes} variables. Use the -ls argument to generate a bigger lattice.")
+    print("Exiting program...")
+    quit()
 
 """
 Preparing Variable Graph
@@ -139,16 +215,82 @@ print("Beginning optimization\n\n")
 start_time = time.perf_counter()
 
 iterations = args.iterations
-
-best_moves_list, best_moves_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, iterations, graph_distance, init_entangles, ave_swap_list, attempts = ofs.iterate_through(lattice_Graph, 
-                                                                                                                                                                                   QUBO_Graph, 
-                                                                                                                                                                                   iterations, 
-                                                                                                                                                                                   args.no_truncate, 
-                                                                                                                                                                                   args.init_entangles_frac, 
-                                                                                                                                                                                   args.init_graph_dist)
+if iterations is None and args.time_limit is None:
+    iterations = 1_000
+
+# Ctrl+C stops the search and shows the best path found so far, and a second Ctrl+C quits right away
+cancel = mp.Event()
+
+def cancel_search(signum, frame):
+
+    print("\nStopping the search. Press Ctrl+C again to quit now.")
+    cancel.set()
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+signal.signal(signal.SIGINT, cancel_search)
+
+# This is called whenever a better path is found
+def show_progress(best_swaps, elapsed, iteration):
+
+    print(f"    {best_swaps} swaps after {round(elapsed, ndigits=2)} seconds")
+
+
+if args.workers > 1:
+    best_moves_list, best_moves_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, iterations, graph_distance, init_entangles, ave_swap_list, attempts = ofs.iterate_through_parallel(lattice_Graph, 
+                                                                                                                                                                                                QUBO_Graph, 
+                                                                                                                                                                                                iterations, 
+                                                                                                                                                                                                args.no_truncate, 
+                                                                                                                                                                                                args.init_entangles_frac, 
+                                                                                                                                                                                                args.init_graph_dist,
+                                                                                                                                                                                                args.workers,
+                                                                                                                                                                                                objective=args.objective,
+                                                                                                                                                                                                placement_search=args.placement_search,
+                                                                                                                                                                                                time_limit=args.time_limit,
+                                                                                                                                                                                                progress=show_progress,
+                                                                                                                                                                                                cancel=cancel,
+                                                                                                                                                                                                threshold_quantile=args.adaptive_thresholds,
+                                                                                                                                                                                                dedupe_layouts=args.dedupe_layouts,
+                                                                                                                                                                                                trial_allocation=args.trial_allocation,
+                                                                                                                                                                                                router=args.router,
+                                                                                                                                                                                                beam_width=args.beam_width,
+                                                                                                                                                                                                batch_trials=args.batch_trials)
+else:
+    best_moves_list, best_moves_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, iterations, graph_distance, init_entangles, ave_swap_list, attempts = ofs.iterate_through(lattice_Graph, 
+                                                                                                                                                                                       QUBO_Graph, 
+                                                                                                                                                                                       iterations, 
+                                                                                                                                                                                       args.no_truncate, 
+                                                                                                                                                                                       args.init_entangles_frac, 
+                                                                                                                                                                                       args.init_graph_dist,
+                                                                                                                                                                                       objective=args.objective,
+                                                                                                                                                                                       placement_search=args.placement_search,
+                                                                                                                                                                                       time_limit=args.time_limit,
+                                                                                                                                                                                       progress=show_progress,
+                                                                                                                                                                                       cancel=cancel,
+                                                                                                                                                                                       threshold_quantile=args.adaptive_thresholds,
+                                                                                                                                                                                       dedupe_layouts=args.dedupe_layouts,
+                                                                                                                                                                                       trial_allocation=args.trial_allocation,
+                                                                                                                                                                                       router=args.router,
+                                                                                                                                                                                       beam_width=args.beam_width,
+                                                                                                                                                                                       batch_trials=args.batch_trials)
+
+signal.signal(signal.SIGINT, signal.default_int_handler)
 
 print()
-print(f"Finished {args.iterations} iterations.\n")
+if cancel.is_set():
+    print(f"Stopped after {iterations} iterations.\n")
+else:
+    print(f"Finished {iterations} iterations.\n")
+
+"""
+Post Processing
+"""
+
+# Merge swaps into the gates next to them and drop swaps that undo each other
+num_swaps = best_moves_key.count("s")
+best_moves_list, best_moves_key = post_process_moves(lattice_Graph, QUBO_Graph, best_lattice_nodes, best_moves_list, best_moves_key)
+
+if best_moves_key.count("s") < num_swaps:
+    print(f"Post processing removed {num_swaps - best_moves_key.count('s')} swaps.\n")
 
 """
 Display Solution Information
@@ -157,6 +299,7 @@ Display Solution Information
 # Clean up calculations
 best_swap = len([key for key in best_moves_key if key == "s"])
 ave_swaps = round(np.average(np.array(list_of_swap_nums)), 3)
+best_depth = calc_depth(best_lattice_nodes, best_moves_list, best_moves_key)
 
 end_time = time.perf_counter()
 run_time = round(end_time - start_time, ndigits=2)
@@ -165,6 +308,10 @@ print()
 print("Best Move List (move #, variables, action):")
 
 for i, (move, key) in enumerate(zip(best_moves_list, best_moves_key)):
+    # Swaps into an empty lattice site record the site as -1 - site
+    if move[1] < 0:
+        move = f"({move[0]}, empty site {-1 - move[1]})"
+
     if key == "g":
         print(f"{i+1}. {move} - Apply gate")
     elif key == "f":
@@ -174,22 +321,32 @@ for i, (move, key) in enumerate(zip(best_moves_list, best_moves_key)):
     else:
         print("Error")
 
+print()
+print("Parallel Schedule (layer #, move #s):")
+
+for i, layer in enumerate(schedule_moves(best_lattice_nodes, best_moves_list, best_moves_key)):
+    print(f"{i+1}. {[move_num + 1 for move_num in layer]}")
+
 # Reconstruct the solution with the fewest swaps
 lattice_Graph = ofs.reconstruct_lattice(best_lattice_nodes, lattice_Graph)
 QUBO_Graph = ofs.reconstruct_qubo(best_qubo_embed, QUBO_Graph)
 
-# Color graphs
-QUBO_Graph = ofs.color_graph(QUBO_Graph)
-lattice_Graph = ofs.color_lattice(lattice_Graph, QUBO_Graph, args.architecture)
+if not args.no_plot:
+
+    import plotting_functions as gui_func
 
-figure_q = gui_func.makeQUBOGraph(QUBO_Graph)
-figure_q.show()
+    # Color graphs
+    QUBO_Graph = ofs.color_graph(QUBO_Graph)
+    lattice_Graph = ofs.color_lattice(lattice_Graph, QUBO_Graph, args.architecture)
 
-figure_l = gui_func.makeLatticePlot(lattice_Graph)
-figure_l.show()
+    figure_q = gui_func.makeQUBOGraph(QUBO_Graph)
+    figure_q.show()
+
+    figure_l = gui_func.makeLatticePlot(lattice_Graph)
+    figure_l.show()
 
 # Extra plots if wanted
-if args.verbose:
+if args.verbose and not args.no_plot:
     figure_hist = gui_func.makeSwapHist(list_of_swap_nums)
     figure_hist.show()
 
@@ -214,11 +371,13 @@ print(f"# of entanglements: {num_edges}")
 print(f"Runtime: {run_time} seconds")
 print(f"Averaged runtime per trial: {round((run_time / iterations) * 1000, ndigits=3)} ms")
 print(f"Minimum Swaps Needed: {best_swap}")
+print(f"Depth: {best_depth}")
 
 
-print()
-print("Press Enter to finish...")
-input()
+if not args.no_wait:
+    print()
+    print("Press Enter to finish...")
+    input()
 quit()
 
 
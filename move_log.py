@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from array import array
+
+"""
+Compact log of the moves made while solving
+
+Every trial used to build its own lists of move tuples and key letters, starting from a
+copy of the initial entangles, and the lists were deep copied whenever a trial was the
+best so far. Instead, the moves go into one flat integer array, three numbers per move:
+the op code of the move followed by its two qubits. The array only grows when it runs out
+of room, and going back to the start of a trial just moves the end of the log back, so the
+same memory is used for every trial.
+The best path is saved by slicing the array, and only turned back into the move list and
+key at the end.
+"""
+
+# The op code of each kind of move, which is its index in move_keys
+# g is a gate, f is a gate with a free swap and s is a swap
+move_keys = "gfs"
+op_codes = {key: op_code for op_code, key in enumerate(move_keys)}
+
+
+class MoveLog:
+
+    def __init__(self, capacity=256):
+
+        # moves[3 * i : 3 * i + 3] is the op code and two qubits of move i
+        # Only the first num_moves moves are part of the log, the rest is room to grow
+        self.moves = array('h', [0]) * (3 * capacity)
+        self.num_moves = 0
+
+    # Makes a log from moves that are already in the flat form, as an (moves x 3) numpy array
+    @classmethod
+    def from_array(cls, moves):
+
+        new_log = cls.__new__(cls)
+        new_log.moves = array('h', moves.astype('int16').tobytes())
+        new_log.num_moves = len(moves)
+
+        return new_log
+
+    # Adds one move to the end of the log
+    def add(self, qubit1, qubit2, key):
+
+        moves = self.moves
+        i = 3 * self.num_moves
+
+        # Double the room when it runs out
+        if i == len(moves):
+            moves.extend(array('h', [0]) * max(len(moves), 3))
+
+        moves[i] = op_codes[key]
+        moves[i + 1] = qubit1
+        moves[i + 2] = qubit2
+
+        self.num_moves += 1
+
+    # Adds the moves in a move list, where every move has its own key
+    def extend(self, move_list, move_key):
+
+        for (qubit1, qubit2), key in zip(move_list, move_key):
+            self.add(qubit1, qubit2, key)
+
+    # Adds moves that all have the same key
+    def extend_same(self, move_list, key):
+
+        for qubit1, qubit2 in move_list:
+            self.add(qubit1, qubit2, key)
+
+    # Goes back to the first num_moves moves, keeping the room for the rest
+    def truncate(self, num_moves):
+
+        self.num_moves = num_moves
+
+    # Copies the moves of another log into this one, reusing this log's room
+    def restore(self, other):
+
+        size = 3 * other.num_moves
+
+        if len(self.moves) < size:
+            self.moves.extend(array('h', [0]) * (size - len(self.moves)))
+
+        self.moves[:size] = other.moves[:size]
+        self.num_moves = other.num_moves
+
+    # Returns a log of just the moves made so far, which is one slice of the array
+    def copy(self):
+
+        new_log = MoveLog.__new__(MoveLog)
+        new_log.moves = self.moves[:3 * self.num_moves]
+        new_log.num_moves = self.num_moves
+
+        return new_log
+
+    # Returns how many moves of the given kind are in the log
+    def count(self, key):
+
+        return self.moves[:3 * self.num_moves:3].count(op_codes[key])
+
+    # These give the log in the form used by the rest of the code, which is a list of
+    # (qubit, qubit) moves and a list of the key of each move
+    def move_list(self):
+
+        moves = self.moves[:3 * self.num_moves].tolist()
+
+        return list(zip(moves[1::3], moves[2::3]))
+
+    def move_key(self):
+
+        return [move_keys[op_code] for op_code in self.moves[:3 * self.num_moves:3]]
@@ -9,35 +9,177 @@ Created on Sat June 17th
 import numpy as np
 import networkx as nx
 import random
-from pandas import read_csv
-import copy
 import os
-import qiskit.qasm2
+import math
+import time
+import multiprocessing as mp
+from itertools import chain
+import re
+import signal
+
+from embedding_state import EmbeddingState
+from move_log import MoveLog
+from lattice_tables import LatticeTables
+from schedule_funcs import calc_depth, empty_site_label
+from placement_funcs import steepest_descent, tabu_search
+from adaptive_thresholds import AdaptiveThresholds
+from layout_cache import LayoutCache
+from trial_batch import TrialBatch
+import lattice_generator
 
 """
 Functions to Create the Graphs
 """
 
-# Paths to the lattice data files
-Heavy_Hex_nodes_filepath = "./Lattice_Graphs/Heavy_Hex_Nodes.txt"
-Heavy_Hex_edges_filepath = "./Lattice_Graphs/Heavy_Hex_Edges.txt"
-Hex_nodes_filepath = "./Lattice_Graphs/Hex_Nodes.txt"
-Hex_edges_filepath = "./Lattice_Graphs/Hex_Edges.txt"
+# Paths to the lattice data files, which are found relative to this file so it can be run
+# from anywhere
+lattice_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lattice_graphs")
+Heavy_Hex_nodes_filepath = os.path.join(lattice_dir, "Heavy_Hex_Nodes.txt")
+Heavy_Hex_edges_filepath = os.path.join(lattice_dir, "Heavy_Hex_Edges.txt")
+Hex_nodes_filepath = os.path.join(lattice_dir, "Hex_Nodes.txt")
+Hex_edges_filepath = os.path.join(lattice_dir, "Hex_Edges.txt")
 
+# The compiled lattice tables are saved here the first time each lattice is used
+lattice_cache_dir = os.path.join(lattice_dir, "cache")
 
-def qasm_converter(filepath) -> list:
-    circuit_gates = []
+lattice_filepaths = {"HHex": (Heavy_Hex_nodes_filepath, Heavy_Hex_edges_filepath),
+                     "Hex": (Hex_nodes_filepath, Hex_edges_filepath)}
+
+
+# Statements with more than one argument that don't put gates on the qubits
+qasm_skipped_statements = {"barrier", "measure", "reset"}
+
+# How much of a QASM file is read at a time
+qasm_chunk_size = 1 << 20
+
+# These all start with a plain string where they can, because the re module finds those quickly
+qasm_comment_pattern = re.compile(r"//[^\n]*")
+qasm_register_pattern = re.compile(r"qreg\s+([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]")
+qasm_qubit_pattern = re.compile(r"\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*")
+
+# A statement is its name, its parameters if it has any, and then its arguments
+qasm_statement_pattern = re.compile(r"\s*([A-Za-z_]\w*)\s*(\([^)]*\))?(.*)", re.DOTALL)
+
+# Words the reader doesn't understand, which start gate definitions and conditions
+qasm_unsupported_words = ("gate", "opaque", "if")
+qasm_unsupported_pattern = re.compile(r"\b(?:gate|opaque|if)\b")
+
+
+# This reads the pairs of qubits that have two qubit gates between them straight from an
+# OpenQASM 2 file, without building the circuit
+# The file is read in chunks of whole statements. Only statements with a comma in them can be on
+# more than one qubit, and every distinct one of those is only looked at once
+# Qubits are numbered across all of the quantum registers in the order they are declared
+# It only knows the plain gate statements that the test circuits use, so if it finds anything
+# else, like a gate definition or a gate on a whole register, it returns None
+def read_qasm_gates(filepath):
+
+    # The first qubit number of each register
+    register_starts = {}
+    num_qubits = 0
+
+    # A dict keeps the arguments in the order they are found, while ignoring repeats
+    gate_args = {}
+
+    with open(filepath) as file:
+
+        leftover = ""
+
+        while True:
+
+            chunk = file.read(qasm_chunk_size)
+            text = leftover + chunk
+
+            # Only whole lines have their comments taken out, so a comment is never cut in half,
+            # and then only whole statements are read
+            if chunk:
+                cut = text.rfind("\n") + 1
+                text, leftover = text[:cut], text[cut:]
+
+            text = qasm_comment_pattern.sub("", text)
+
+            if chunk:
+                cut = text.rfind(";") + 1
+                text, leftover = text[:cut], text[cut:] + leftover
+
+            if "{" in text or "}" in text:
+                return None
+            if any(word in text for word in qasm_unsupported_words) and qasm_unsupported_pattern.search(text):
+                return None
+
+            for name, size in qasm_register_pattern.findall(text):
+                register_starts[name] = num_qubits
+                num_qubits += int(size)
+
+            for statement in dict.fromkeys(statement for statement in text.split(";") if "," in statement):
+                statement_match = qasm_statement_pattern.fullmatch(statement)
+                if statement_match is None:
+                    return None
+
+                name, params, args = statement_match.groups()
+
+                # A comma in the parameters doesn't mean there is more than one qubit
+                if name not in qasm_skipped_statements and "," in args:
+                    gate_args[args] = None
+
+            if not chunk:
+                break
+
+    circuit_gates = {}
+
+    for args in gate_args:
+
+        qubits = []
+        for arg in args.split(","):
+            qubit_match = qasm_qubit_pattern.fullmatch(arg)
+            if qubit_match is None or qubit_match.group(1) not in register_starts:
+                return None
+
+            qubits.append(register_starts[qubit_match.group(1)] + int(qubit_match.group(2)))
+
+        if len(qubits) > 2:
+            print("Three or more qubit gate found.")
+            print("Exiting program...")
+            quit()
+
+        circuit_gates[(min(qubits), max(qubits))] = None
+
+    return [list(gate) for gate in circuit_gates]
+
+
+# This reads the two qubit gates of any OpenQASM 2 file by loading it as a full qiskit circuit
+# It is much slower than read_qasm_gates, so it is only used for files that it can't read
+def load_qasm_gates(filepath):
+
+    import qiskit.qasm2
+
+    circuit_gates = {}
     qasm_circ = qiskit.qasm2.load(filepath)
 
     for gate in qasm_circ:
+        if gate.operation.name in qasm_skipped_statements:
+            continue
         if gate.operation.num_qubits == 2:
-            if sorted((gate.qubits[0]._index, gate.qubits[1]._index)) not in circuit_gates:
-                circuit_gates.append(sorted((gate.qubits[0]._index, gate.qubits[1]._index)))
+            qubit1 = qasm_circ.find_bit(gate.qubits[0]).index
+            qubit2 = qasm_circ.find_bit(gate.qubits[1]).index
+            circuit_gates[(min(qubit1, qubit2), max(qubit1, qubit2))] = None
         if gate.operation.num_qubits > 2:
             print("Three or more qubit gate found.")
             print("Exiting program...")
             quit()
 
+    return [list(gate) for gate in circuit_gates]
+
+
+# This returns the pairs of qubits with a two qubit gate between them in a QASM file, in the
+# order they first show up
+def qasm_converter(filepath) -> list:
+
+    circuit_gates = read_qasm_gates(filepath)
+
+    if circuit_gates is None:
+        circuit_gates = load_qasm_gates(filepath)
+
     return circuit_gates
 
 # This function takes the number of nodes and the file path as input
@@ -55,10 +197,13 @@ def make_qubo_graph(filepath):
     # txt file extraction
     if file_extension == ".txt":
 
+        # pandas is slow to import, so it is only imported when it is needed
+        from pandas import read_csv
+
         QUBO_edges_info = read_csv(filepath, skiprows=1)
 
         for index, row in QUBO_edges_info.iterrows():
-            graph.add_edge(row['Node1'], row['Node2'])
+            graph.add_edge(int(row['Node1']), int(row['Node2']))
     
     elif file_extension == ".qasm":
         QUBO_edges = qasm_converter(filepath)
@@ -242,26 +387,35 @@ def find_greens(graph):
     return graph
 
 
-# This makes the qubit lattice from an imported file
-def import_lattice(lattice_geo):
-    # This will just be a premade lattice with a certain number of qubits
+# This loads the precomputed tables of a lattice, from the cache if they have been made before
+# Without a number of qubits, it is the lattice in the lattice files. Otherwise it is the smallest
+# generated lattice with at least that many qubits
+def load_lattice_tables(lattice_geo, num_qubits=None):
 
-    if lattice_geo == "HHex":
-        lattice_node_info = read_csv(Heavy_Hex_nodes_filepath, skiprows=1)
-        lattice_edges_info = read_csv(Heavy_Hex_edges_filepath, skiprows=1)
-    if lattice_geo == "Hex":
-        lattice_node_info = read_csv(Hex_nodes_filepath, skiprows=1)
-        lattice_edges_info = read_csv(Hex_edges_filepath, skiprows=1)
+    if num_qubits is None:
+        nodes_filepath, edges_filepath = lattice_filepaths[lattice_geo]
+
+        return LatticeTables.load(nodes_filepath, edges_filepath, lattice_cache_dir)
+
+    k = lattice_generator.smallest_lattice_size(lattice_geo, num_qubits)
+
+    return lattice_generator.load_generated_tables(lattice_geo, k, lattice_cache_dir)
 
-    lattice_graph = nx.Graph()
 
-    for index, row in lattice_node_info.iterrows():
+# This makes the qubit lattice from an imported file, or generates one with at least num_qubits
+# qubits if that is given
+def import_lattice(lattice_geo, num_qubits=None):
+    # This will just be a premade lattice with a certain number of qubits
+
+    lattice_tables = load_lattice_tables(lattice_geo, num_qubits)
 
-        lattice_graph.add_node(index, qubit=-1)
+    lattice_graph = nx.Graph()
 
-    for index, row in lattice_edges_info.iterrows():
+    lattice_graph.add_nodes_from(range(lattice_tables.num_sites), qubit=-1)
+    lattice_graph.add_edges_from(lattice_tables.edges)
 
-        lattice_graph.add_edge(row['Node1'], row['Node2'])
+    # The tables go along with the graph, so solving on it doesn't have to work them out again
+    lattice_graph.graph['lattice_tables'] = lattice_tables
     
     return lattice_graph
 
@@ -269,14 +423,16 @@ def import_lattice(lattice_geo):
 # This takes in a lattice and colors it
 def color_lattice(graph, QUBO, lattice_geo):
 
-    if lattice_geo == "HHex":
-        lattice_node_info = read_csv(Heavy_Hex_nodes_filepath, skiprows=1)
-    if lattice_geo == "Hex":
-        lattice_node_info = read_csv(Hex_nodes_filepath, skiprows=1)
+    # Lattices from import_lattice carry their own positions
+    lattice_tables = graph.graph.get('lattice_tables')
+    if lattice_tables is None:
+        lattice_tables = load_lattice_tables(lattice_geo)
+
+    positions = lattice_tables.positions.tolist()
 
     # First, turn everything black
-    for index, row in lattice_node_info.iterrows():
-        graph.nodes[index]['pos'] = (row['x_coor'], row['y_coor'])
+    for index, (x_coor, y_coor) in enumerate(positions):
+        graph.nodes[index]['pos'] = (x_coor, y_coor)
         graph.nodes[index]['size'] = 100
         graph.nodes[index]['color'] = 'k'
 
@@ -296,29 +452,25 @@ Functions to do various distance calculations
 
 # This function calculates the sum of distances for each qubit from all the qubits it
 # needs to entangle with
-def calc_graph_total_distance(QUBO, all_path_lengths, list_of_entangles):
+# This recalculates it from scratch, the running value is kept in state.total_distance
+def calc_graph_total_distance(state, dist_matrix):
 
-    total_dist = 0
+    site_of_qubit = state.site_of_qubit_view()
+    entangle_array = state.entangle_array[state.pending_mask()]
 
     # Adds up the distance between every pair of qubits that needs to be entangled
-    for entangle in list_of_entangles:
-            
-        total_dist += all_path_lengths[QUBO.nodes[entangle[0]]['embedded']][QUBO.nodes[entangle[1]]['embedded']]
-
-    return total_dist
+    # The distance matrix is indexed by the sites of both ends of every entangle at once
+    return int(dist_matrix[site_of_qubit[entangle_array[:, 0]], site_of_qubit[entangle_array[:, 1]]].sum())
 
 
 # Function to calculate the total distance from a qubit to all of the qubits it
 # needs to entangle with
 # All positions are positions on the lattice
-def calc_distance_change(all_path_lengths, list_of_entangles, qubit1, qubit2, end_pos, QUBO_Graph):
+def calc_distance_change(all_path_lengths, qubit1, qubit2, end_pos, state):
 
-    start_pos = QUBO_Graph.nodes[qubit1]['embedded']
-
-    if qubit2 != -1:
-        do_extra = True
-    else:
-        do_extra = False
+    site_of_qubit = state.site_of_qubit
+    pending = state.pending
+    start_pos = site_of_qubit[qubit1]
 
     # This calculation has the problem that it doesn't switch the qubits before testing the distances
     # In order to remedy this oversight, if moving the qubit would generate a distance of 0 from it's
@@ -328,80 +480,111 @@ def calc_distance_change(all_path_lengths, list_of_entangles, qubit1, qubit2, en
     # So, that qubit must be switching places with the original qubit.
     # This means that the new distance between them will be the path length between them
     path_length = all_path_lengths[start_pos][end_pos]
+    start_dists = all_path_lengths[start_pos]
+    end_dists = all_path_lengths[end_pos]
 
     dist_at_start = 0
     dist_at_end = 0
 
     # Find all the entangles left to do for that qubit
-    for entangle in list_of_entangles:
-        if entangle[0] == qubit1:
+    # Only the entangles of the two qubits are looked at, not the whole list
+    for partner, entangle_id in state.partners[qubit1]:
+        if pending[entangle_id]:
 
-            embed_node = QUBO_Graph.nodes[entangle[1]]['embedded']
+            embed_node = site_of_qubit[partner]
 
-            dist_at_start += all_path_lengths[start_pos][embed_node]
+            dist_at_start += start_dists[embed_node]
 
-            if all_path_lengths[end_pos][embed_node] == 0:
+            if end_dists[embed_node] == 0:
                 dist_at_end += path_length
             else:
-                dist_at_end += all_path_lengths[end_pos][embed_node]
+                dist_at_end += end_dists[embed_node]
 
-        elif entangle[1] == qubit1:
+    # This half keeps track of the distance change from the second qubit
+    # The start and end nodes are swapped for this
+    if qubit2 != -1:
+        for partner, entangle_id in state.partners[qubit2]:
+            if pending[entangle_id]:
 
-            embed_node = QUBO_Graph.nodes[entangle[0]]['embedded']
+                embed_node = site_of_qubit[partner]
 
-            dist_at_start += all_path_lengths[start_pos][embed_node]
+                dist_at_start += end_dists[embed_node]
 
-            if all_path_lengths[end_pos][embed_node] == 0:
-                dist_at_end += path_length
-            else:
-                dist_at_end += all_path_lengths[end_pos][embed_node]
-        
-        # This half keeps track of the distance change from the second qubit
-        # The start and end nodes are swapped for this
-        if do_extra and entangle[0] == qubit2:
+                if start_dists[embed_node] == 0:
+                    dist_at_end += path_length
+                else:
+                    dist_at_end += start_dists[embed_node]
 
-            embed_node = QUBO_Graph.nodes[entangle[1]]['embedded']
+    return dist_at_end - dist_at_start
 
-            dist_at_start += all_path_lengths[end_pos][embed_node]
 
-            if all_path_lengths[start_pos][embed_node] == 0:
-                dist_at_end += path_length
-            else:
-                dist_at_end += all_path_lengths[start_pos][embed_node]
+# This function finds a lower bound on the number of swaps still needed to finish the graph
+# A pending entangle at a distance d needs its qubits moved d - 1 steps closer. A swap moves
+# two qubits by one step each, and so does the free swap that can come with each pending
+# gate. Free swaps don't count as swaps, so every pending gate on one of the qubits is taken
+# off what the swaps have to do
+# Two bounds are used, and the larger one is returned:
+#   - For a single entangle, a swap can only bring it one step closer
+#   - For a set of entangles that share no qubits, a swap can bring at most two of them
+#     one step closer
+def calc_swap_lower_bound(state, all_path_lengths):
 
-        elif do_extra and entangle[1] == qubit2:
+    site_of_qubit = state.site_of_qubit
+    entangles = state.entangles
+    num_pending_of = state.num_pending_of
 
-            embed_node = QUBO_Graph.nodes[entangle[0]]['embedded']
+    # Only entangles that are not already next to each other need anything done
+    far_entangles = []
+    for entangle_id in state.pending_entangles():
+        qubit1, qubit2 = entangles[entangle_id]
+        dist = all_path_lengths[site_of_qubit[qubit1]][site_of_qubit[qubit2]]
 
-            dist_at_start += all_path_lengths[end_pos][embed_node]
+        if dist > 1:
+            far_entangles.append((dist, qubit1, qubit2))
 
-            if all_path_lengths[start_pos][embed_node] == 0:
-                dist_at_end += path_length
-            else:
-                dist_at_end += all_path_lengths[start_pos][embed_node]
+    if not far_entangles:
+        return 0
 
-    return dist_at_end - dist_at_start
+    # Longest entangles first, so the set of entangles that share no qubits is a good one
+    far_entangles.sort(reverse=True)
 
+    best_single = 0
+    matched_qubits = set()
+    match_steps = 0
+    match_free_moves = 0
+    match_size = 0
 
-"""
-Functions to Map the QUBO to the Lattice
-"""
+    for dist, qubit1, qubit2 in far_entangles:
+        # The number of pending gates on each qubit, other than the one being counted, is
+        # how many free swaps could still move it
+        free_moves1 = num_pending_of[qubit1] - 1
+        free_moves2 = num_pending_of[qubit2] - 1
+
+        best_single = max(best_single, dist - 1 - free_moves1 - free_moves2)
 
+        if qubit1 not in matched_qubits and qubit2 not in matched_qubits:
+            matched_qubits.update((qubit1, qubit2))
+            match_steps += dist - 1
+            match_free_moves += free_moves1 + free_moves2
+            match_size += 1
 
-# This just places the nodes onto the graph in the given spot
-def place_node(lattice_Graph, QUBO_Graph, lattice_node, qubo_node):
-    # Places the node
-    lattice_Graph.nodes[lattice_node]['qubit'] = qubo_node
+    match_steps = max(match_steps - match_free_moves, 0)
+    if match_size > 1:
+        match_steps = -(-match_steps // 2)
 
-    QUBO_Graph.nodes[qubo_node]['placed'] = True
-    QUBO_Graph.nodes[qubo_node]['embedded'] = lattice_node
+    return max(best_single, match_steps)
+
+
+"""
+Functions to Map the QUBO to the Lattice
+"""
 
 
 # This function finds an open space to place an end tail
-def find_open_node(lattice_Graph, QUBO_Graph, start_node, connecting_node):
+def find_open_node(lattice_Graph, state, start_node, connecting_node):
 
     # Transform the connecting_node to the lattice graph
-    connecting_node = QUBO_Graph.nodes[connecting_node]['embedded']
+    connecting_node = state.site_of_qubit[connecting_node]
 
     placement_node = -1
 
@@ -436,7 +619,7 @@ def find_open_node(lattice_Graph, QUBO_Graph, start_node, connecting_node):
         for node in potential_empty_nodes:
 
             # If there's nothing there, place the qubit
-            if lattice_Graph.nodes[node]['qubit'] == -1:
+            if state.qubit_at_site[node] == -1:
                 placement_node = node
                 #print(f"The node {start_node} will be placed at location: {node}")
                 break
@@ -454,53 +637,55 @@ def find_open_node(lattice_Graph, QUBO_Graph, start_node, connecting_node):
 
 
 # This function maps the non-green nodes of the QUBO to the graph
-def place_initial_qubits(lattice_Graph, QUBO_Graph):
+# rng is anything with the same choices method as the random module, like a seeded random.Random
+def place_initial_qubits(QUBO_Graph, state, rng=random):
 
     # Places the first qubit
     #print(QUBO_Graph.nodes(data=True))
-    cand_qubits = [x for x, node in QUBO_Graph.nodes(data=True) if not node['green']]
+    non_green_qubits = [x for x, node in QUBO_Graph.nodes(data=True) if not node['green']]
+    cand_qubits = non_green_qubits
 
     # Picks the first node
-    rand_node = random.choices(cand_qubits, k=1)[0]
+    rand_node = rng.choices(cand_qubits, k=1)[0]
 
     #print(f"The first node to be placed is {rand_node}")
     #print(f"Node {rand_node} was placed at 0")
 
     # Places the first node
-    place_node(lattice_Graph, QUBO_Graph, 0, rand_node)
+    state.place(0, rand_node)
 
     prev_node = rand_node
 
     # Places the rest of the qubits that are not green
-    for i in range(len([x for x, node in QUBO_Graph.nodes(data=True) if not node['green']]) - 1):
+    for i in range(len(non_green_qubits) - 1):
 
         # Chooses new candidate qubits
-        cand_qubits = [x for x, node in QUBO_Graph.nodes(data=True) if (x in nx.neighbors(QUBO_Graph, prev_node) and not node['placed'] and not node['green'])]
+        cand_qubits = [x for x in QUBO_Graph.neighbors(prev_node) if (not state.is_placed(x) and not QUBO_Graph.nodes[x]['green'])]
 
         # If all the neighbors of the previous node have been placed, then randomly
         # choose from unplaced qubits
         if not cand_qubits:
-            cand_qubits = [x for x, node in QUBO_Graph.nodes(data=True) if (not node['placed'] and not node['green'])]
+            cand_qubits = [x for x in non_green_qubits if not state.is_placed(x)]
         
         #print(f"The candidate qubits for the next placement is {cand_qubits}")
 
-        rand_node = random.choices(cand_qubits, k=1)[0]
+        rand_node = rng.choices(cand_qubits, k=1)[0]
 
         #print(f"The next node to be placed is {rand_node} at lattice location {i+1}")
 
         # The lattice point is i + 1 because we are placing the qubits onto the
         # lattice sequentially
-        place_node(lattice_Graph, QUBO_Graph, i+1, rand_node)
+        state.place(i+1, rand_node)
 
         prev_node = rand_node
     
     #print("All of the non-green nodes have been placed")
     
-    return lattice_Graph, QUBO_Graph
+    return state
 
 
 # This places all the green qubits
-def place_green_qubits(lattice_Graph, QUBO_Graph):
+def place_green_qubits(lattice_Graph, QUBO_Graph, state):
 
     #print("Beginning placement of green nodes")
 
@@ -512,7 +697,7 @@ def place_green_qubits(lattice_Graph, QUBO_Graph):
         # The connecting qubit will always have a degree of greater than two, or it would be part of the chain
         connecting_node = [x for x in nx.neighbors(QUBO_Graph, start_node) if QUBO_Graph.degree[x] > 2][0]
         
-        #print(f"This chain will connect to the main graph at {connecting_node}, which is embedded at location {QUBO_Graph.nodes[connecting_node]['embedded']}")
+        #print(f"This chain will connect to the main graph at {connecting_node}, which is embedded at location {state.site_of_qubit[connecting_node]}")
 
         while True:
 
@@ -520,12 +705,12 @@ def place_green_qubits(lattice_Graph, QUBO_Graph):
 
             # Checks if there is an open spot next to the connecting node
             # The connecting node will always already be embedded, so it will have a spot on the lattice graph
-            for placement_spot in nx.neighbors(lattice_Graph, QUBO_Graph.nodes[connecting_node]['embedded']):
+            for placement_spot in nx.neighbors(lattice_Graph, state.site_of_qubit[connecting_node]):
 
                 # If no qubit, place the node
-                if lattice_Graph.nodes[placement_spot]['qubit'] == -1:
+                if state.qubit_at_site[placement_spot] == -1:
 
-                    place_node(lattice_Graph, QUBO_Graph, placement_spot, start_node)
+                    state.place(placement_spot, start_node)
                     placed = True
                     
                     #print(f"The node {start_node} has been placed on the lattice at location {placement_spot}")
@@ -534,9 +719,9 @@ def place_green_qubits(lattice_Graph, QUBO_Graph):
             # If a placement spot hasn't been found, search further away
             if not placed:
 
-                placement_spot = find_open_node(lattice_Graph, QUBO_Graph, start_node, connecting_node)
+                placement_spot = find_open_node(lattice_Graph, state, start_node, connecting_node)
 
-                place_node(lattice_Graph, QUBO_Graph, placement_spot, start_node)
+                state.place(placement_spot, start_node)
                     
                 #print(f"The node {start_node} has been placed on the lattice at location {placement_spot}")
             
@@ -549,19 +734,18 @@ def place_green_qubits(lattice_Graph, QUBO_Graph):
                 connecting_node = start_node
 
                 # The qubit to be placed in the next one in line
-                start_node = [x for x in nx.neighbors(QUBO_Graph, connecting_node) if QUBO_Graph.nodes[x]['embedded'] == -1][0]
+                start_node = [x for x in nx.neighbors(QUBO_Graph, connecting_node) if not state.is_placed(x)][0]
 
                 #print(f"Now, we will connect qubit {start_node} to qubit {connecting_node}")
     
     #print("All of the green nodes have been placed")
 
-    return lattice_Graph, QUBO_Graph
+    return state
 
 
 # This function modifies the map and tries to reduce its overall distance function
-def distance_adjustments(lattice_Graph, QUBO_Graph, all_path_lengths):
+def distance_adjustments(QUBO_Graph, state, all_path_lengths, rng=random):
 
-    list_of_entangles = list(QUBO_Graph.edges)
     nodes = list(QUBO_Graph.nodes())
 
     # Keep trying things until we get 5 qubits in a row that don't improve the graph if moved
@@ -572,29 +756,28 @@ def distance_adjustments(lattice_Graph, QUBO_Graph, all_path_lengths):
 
     while strike_count < 50:
 
-        rand_qubit1 = random.choices(nodes, k=1)[0]
-        qubit_embed1 = QUBO_Graph.nodes[rand_qubit1]['embedded']
+        rand_qubit1 = rng.choices(nodes, k=1)[0]
+        qubit_embed1 = state.site_of_qubit[rand_qubit1]
 
-        rand_qubit2 = random.choices(nodes, k=1)[0]
-        qubit_embed2 = QUBO_Graph.nodes[rand_qubit2]['embedded']
+        rand_qubit2 = rng.choices(nodes, k=1)[0]
+        qubit_embed2 = state.site_of_qubit[rand_qubit2]
 
-        dist_change = calc_distance_change(all_path_lengths, list_of_entangles, rand_qubit1,  rand_qubit2, qubit_embed2, QUBO_Graph)
+        dist_change = calc_distance_change(all_path_lengths, rand_qubit1,  rand_qubit2, qubit_embed2, state)
 
         if dist_change < 0:
 
             #print(f"The qubits {rand_qubit1} and {rand_qubit2} will be swapped, "
             #        f"because the distance change is {dist_change}")
 
-            swap_qubits(lattice_Graph, QUBO_Graph, qubit_embed1, qubit_embed2)
+            apply_swap(state, all_path_lengths, qubit_embed1, qubit_embed2, dist_change)
 
-            #graph_dist = calc_graph_total_distance(QUBO_Graph, all_path_lengths, list_of_entangles)
-            #print(f"The total graph distance is now {graph_dist}\n")
+            #print(f"The total graph distance is now {state.total_distance}\n")
 
             strike_count = 0
         else:
             strike_count += 1
     
-    return lattice_Graph, QUBO_Graph
+    return state
         
 
 """
@@ -602,33 +785,35 @@ Swapping Functions
 """
 
 
-# This function swaps two qubits
-# It doesn't return anything, it just swaps them in the function
-def swap_qubits(lattice_Graph, QUBO_Graph, lattice_point1, lattice_point2):
-
-    qubit_1 = lattice_Graph.nodes[lattice_point1]['qubit']
-    qubit_2 = lattice_Graph.nodes[lattice_point2]['qubit']
-
-    lattice_Graph.nodes[lattice_point1]['qubit'], lattice_Graph.nodes[lattice_point2]['qubit'] = lattice_Graph.nodes[lattice_point2]['qubit'], lattice_Graph.nodes[lattice_point1]['qubit']
-
-    if qubit_1 != -1 and qubit_2 != -1:
+# This function swaps the qubits on two lattice sites and keeps the distance function of the
+# graph up to date
+# The distance change can be passed in if it has already been calculated for this exact swap
+def apply_swap(state, all_path_lengths, site1, site2, dist_change=None):
 
-        QUBO_Graph.nodes[qubit_1]['embedded'], QUBO_Graph.nodes[qubit_2]['embedded'] = lattice_point2, lattice_point1
-    
-    elif qubit_2 == -1:
-
-        QUBO_Graph.nodes[qubit_1]['embedded'] = lattice_point2
-    
-    else:
+    if dist_change is None:
+        qubit1 = state.qubit_at_site[site1]
+        qubit2 = state.qubit_at_site[site2]
 
-        QUBO_Graph.nodes[qubit_2]['embedded'] = lattice_point1
+        if qubit1 != -1:
+            dist_change = calc_distance_change(all_path_lengths, qubit1, qubit2, site2, state)
+        elif qubit2 != -1:
+            dist_change = calc_distance_change(all_path_lengths, qubit2, qubit1, site1, state)
+        else:
+            dist_change = 0
 
-    return None
+    state.swap(site1, site2)
+    state.total_distance += dist_change
 
 
 # This function runs all the entanglements for the current graph
-# May want to have it check all edges in the QUBO graph for edges in the lattice graph instead
-def get_current_entangles(lattice_Graph, QUBO_Graph, list_of_entangles, all_path_lengths):
+# Only the pending entangles of the qubits that have moved since the last time this ran can
+# have become possible, so only those are checked
+# If moved_qubits is None, every pending entangle is checked
+def get_current_entangles(state, all_path_lengths, moved_qubits=None):
+
+    site_of_qubit = state.site_of_qubit
+    partners = state.partners
+    pending = state.pending
 
     # We want to entangle everything on the graph, but then go back through and check to see if 
     # it should have been swapped instead
@@ -637,56 +822,44 @@ def get_current_entangles(lattice_Graph, QUBO_Graph, list_of_entangles, all_path
     # Keeps track of entanglements done
     move_dict = {}
 
-    #print(f"Here is the list of qubits that need to be entangled: {list_of_entangles}")
-
-    for node_1, node_2 in lattice_Graph.edges:
-
-        # This function transforms the edge in the lattice graph to an edge in the 
-        # qubit graph
-        # There is a difference between (0, 1) and (1, 0)
-        edge1 = (lattice_Graph.nodes[node_1]['qubit'], lattice_Graph.nodes[node_2]['qubit'])
-        edge2 = (lattice_Graph.nodes[node_2]['qubit'], lattice_Graph.nodes[node_1]['qubit'])
-
-        # This is the case where there is no qubit embedded at that spot
-        if edge1[0] == -1 or edge1[1] == -1 or edge2[0] == -1 or edge2[1] == -1:
-            pass
-
-        elif edge1 in list_of_entangles:
-            
-            list_of_entangles.remove(edge1)
-            #print(f"{edge1[0]}, {edge1[1]} were entangled")
+    if moved_qubits is None:
+        cand_entangles = state.pending_entangles()
+    else:
+        cand_entangles = {entangle_id for qubit in moved_qubits for partner, entangle_id in partners[qubit] if pending[entangle_id]}
 
-            # Check if worth swapping
-            dis_change = calc_distance_change(all_path_lengths, list_of_entangles, edge1[0], edge1[1], node_2, QUBO_Graph)
+    # Nothing moves until the free swaps below, so only qubits that are already next
+    # to each other can be entangled
+    # They are done in the order of where they are on the lattice, the same as going through
+    # the lattice edges, because that order decides which of them get the free swaps
+    entangle_sites = []
+    for entangle_id in cand_entangles:
+        qubit1, qubit2 = state.entangles[entangle_id]
+        site1, site2 = site_of_qubit[qubit1], site_of_qubit[qubit2]
 
-            if dis_change < 0:
-                recheck.append(edge1)
+        if all_path_lengths[site1][site2] == 1:
+            entangle_sites.append((min(site1, site2), max(site1, site2), entangle_id))
 
-            #print(f"{edge1} was entangled")
-            move_dict.update({edge1: "g"})
-            #print(f" - {edge1} was added to move_dict - 1")
+    entangle_sites.sort()
 
-        elif edge2 in list_of_entangles:
-            
-            list_of_entangles.remove(edge2)
-            #print(f"{edge1[0]}, {edge1[1]} were entangled")
+    for site1, site2, entangle_id in entangle_sites:
 
-            # Check if worth swapping
-            dis_change = calc_distance_change(all_path_lengths, list_of_entangles, edge2[0], edge2[1], node_1, QUBO_Graph)
+        # Moves are always recorded in the same order as the entangle in the QUBO graph
+        entangle = state.entangles[entangle_id]
 
-            if dis_change < 0:
-                recheck.append(edge2)
+        state.complete_entangle(entangle_id)
+        state.total_distance -= 1
+        #print(f"{entangle[0]}, {entangle[1]} were entangled")
 
-            # Sometimes, the code doesn't realize that swapping a qubit with a gate will result in a free
-            # swap right after, so I have to check for that 
+        # Check if worth swapping
+        dis_change = calc_distance_change(all_path_lengths, entangle[0], entangle[1], site_of_qubit[entangle[1]], state)
 
-            #print(f"{edge2} was entangled")
-            move_dict.update({edge2: "g"})
-            #print(f" - {edge2} was added to move_dict - 2")
+        # Sometimes, the code doesn't realize that swapping a qubit with a gate will result in a free
+        # swap right after, so I have to check for that 
+        if dis_change < 0:
+            recheck.append(entangle)
 
-        else:
-            #print(f"{edge1} and {edge2} were not in the list of entanglements")
-            pass
+        #print(f"{entangle} was entangled")
+        move_dict.update({entangle: "g"})
 
     #print(f"Recheck: {recheck}")
     #print(f"Move dict {move_dict}")
@@ -694,18 +867,18 @@ def get_current_entangles(lattice_Graph, QUBO_Graph, list_of_entangles, all_path
     # Now go through a second pass and see which ones in here can be given a free swap
     for q1, q2 in recheck:
         
-        n1, n2 = QUBO_Graph.nodes[q1]['embedded'], QUBO_Graph.nodes[q2]['embedded']
+        n1, n2 = site_of_qubit[q1], site_of_qubit[q2]
         #print(f"Currently rechecking {q1, q2}, at position {n1, n2}")
 
         # Ensure that the two qubits are still next to each other
-        if n1 in nx.neighbors(lattice_Graph, n2):
+        if all_path_lengths[n1][n2] == 1:
 
             #print(f"{q1}, {q2} got free swapped")
 
             move_dict[(q1, q2)] = "f"
             #print(f"{(q1, q2)} was updated in move_dict")
 
-            swap_qubits(lattice_Graph, QUBO_Graph, n1, n2)
+            apply_swap(state, all_path_lengths, n1, n2)
     
     # Finally, just have to convert the dictionary back to a list
     entangles_done = [key for key, value in move_dict.items() if value == "g"]
@@ -717,33 +890,54 @@ def get_current_entangles(lattice_Graph, QUBO_Graph, list_of_entangles, all_path
     #print(f"Entangles done: {entangles_done}")
     #print(f"Move key: {move_key}")
 
-    return lattice_Graph, QUBO_Graph, list_of_entangles, entangles_done, move_key
+    return entangles_done, move_key
+
+
+# Returns the qubits that were moved by free swaps in a list of moves, which is needed for
+# the next call to get_current_entangles
+def free_swapped_qubits(move_list, move_list_key):
+
+    return {qubit for move, key in zip(move_list, move_list_key) if key == "f" for qubit in move}
+
+
+# Returns what a move records for a lattice site, which is the qubit on it, or the site itself
+# for an empty site, so that the move can be replayed
+def move_label(state, site):
+
+    qubit = state.qubit_at_site[site]
+
+    return qubit if qubit != -1 else empty_site_label(site)
 
 
 # This function finds the next position for the lattice graph to swap to
-def perform_next_swap(lattice_Graph, QUBO_Graph, list_of_entangles, all_path_lengths):
+def perform_next_swap(lattice_tables, state, all_path_lengths, rng=random):
+
+    qubit_at_site = state.qubit_at_site
+    site_of_qubit = state.site_of_qubit
 
     # Find the next graph to swap to
     shortest_swap_dist = 100000000
-    cand_swap_list = [] # This will be a list of tuples, where tuples are the path
+    cand_swap_list = [] # This will be a list of tuples, where tuples are the end points of the path
 
     # Check the distances between the entanglements that still need to be done
-    for entangle in list_of_entangles:
-        path = nx.astar_path(lattice_Graph, QUBO_Graph.nodes[entangle[0]]['embedded'], QUBO_Graph.nodes[entangle[1]]['embedded'])
-        #print(f"The distance between the qubits {entangle[0]} and {entangle[1]} is {len(path)}")
-        #print(f"\tThis would be along the path {path}")
-
-        # A path length of 3 is the shortest possible swap - 1 swap, so it should be done
-        if len(path) < shortest_swap_dist:
-            #print(f"\tThis path of distance {len(path)} is the new shortest path")
-            cand_swap_list = [path]
-            shortest_swap_dist = len(path)
-        elif len(path) == shortest_swap_dist:
-            #print(f"\tThis path of distance {len(path)} is short enough to be added to the candidate list")
-            cand_swap_list.append(path)
+    # Only the distances are needed to pick one, so the path is walked afterwards
+    for entangle_id in state.pending_entangles():
+        entangle = state.entangles[entangle_id]
+        start, end = site_of_qubit[entangle[0]], site_of_qubit[entangle[1]]
+        dist = all_path_lengths[start][end]
+        #print(f"The distance between the qubits {entangle[0]} and {entangle[1]} is {dist}")
+
+        # A distance of 2 is the shortest possible swap - 1 swap, so it should be done
+        if dist < shortest_swap_dist:
+            #print(f"\tThis path of distance {dist} is the new shortest path")
+            cand_swap_list = [(start, end)]
+            shortest_swap_dist = dist
+        elif dist == shortest_swap_dist:
+            #print(f"\tThis path of distance {dist} is short enough to be added to the candidate list")
+            cand_swap_list.append((start, end))
 
     #print(f"The next path will be chosen from a list with {len(cand_swap_list)} items: {cand_swap_list}")
-    path = random.choices(cand_swap_list, k=1)[0]
+    path = lattice_tables.path(*rng.choices(cand_swap_list, k=1)[0])
 
     #print(f"\nThe next swap will be qubits {entangle[0]} and {entangle[1]} with a path of {path}\n")
 
@@ -751,14 +945,19 @@ def perform_next_swap(lattice_Graph, QUBO_Graph, list_of_entangles, all_path_len
     swaps = 0
     swap_list = []
 
-    left_qubit = lattice_Graph.nodes[path[0]]['qubit']
-    right_qubit = lattice_Graph.nodes[path[-1]]['qubit']
+    left_qubit = qubit_at_site[path[0]]
+    right_qubit = qubit_at_site[path[-1]]
 
     # This is the total distance from the qubit to all of its entangles
     # It compares that total distance while in its original spot with the total
     # distance from the spot it will be moving to, returning the difference
-    dist_change_l = calc_distance_change(all_path_lengths, list_of_entangles, left_qubit, lattice_Graph.nodes[path[1]]['qubit'], path[1], QUBO_Graph)
-    dist_change_r = calc_distance_change(all_path_lengths, list_of_entangles, right_qubit, lattice_Graph.nodes[path[-2]]['qubit'], path[-2], QUBO_Graph)
+    dist_change_l = calc_distance_change(all_path_lengths, left_qubit, qubit_at_site[path[1]], path[1], state)
+    dist_change_r = calc_distance_change(all_path_lengths, right_qubit, qubit_at_site[path[-2]], path[-2], state)
+
+    # Moving one side changes the distance change of the other side, so these keep track of
+    # whether a distance change can still be used to update the distance function of the graph
+    fresh_l = True
+    fresh_r = True
 
     #print(f"Initial distance change left is {dist_change_l}")
     #print(f"Initial distance change right is {dist_change_r}")
@@ -774,46 +973,39 @@ def perform_next_swap(lattice_Graph, QUBO_Graph, list_of_entangles, all_path_len
             # This works because it is only swapping the qubits on top of the lattice points,
             # so it is only changing the variables attached to each lattice point
             # The lattice points remain unchanged in this
-            swap_list.append((lattice_Graph.nodes[path[marker_l]]['qubit'], lattice_Graph.nodes[path[marker_l+1]]['qubit']))
-            swap_qubits(lattice_Graph, QUBO_Graph, path[marker_l], path[marker_l+1])
+            swap_list.append((qubit_at_site[path[marker_l]], move_label(state, path[marker_l+1])))
+            apply_swap(state, all_path_lengths, path[marker_l], path[marker_l+1], dist_change_l if fresh_l else None)
+            fresh_r = False
             swaps += 1
 
-            #print(f"The left qubit {lattice_Graph.nodes[path[marker_l]]['qubit']} will be swapped with {lattice_Graph.nodes[path[marker_l+1]]['qubit']}")
+            #print(f"The left qubit {qubit_at_site[path[marker_l]]} will be swapped with {qubit_at_site[path[marker_l+1]]}")
 
             # We only need to advance if we are not done swapping
             if swaps < len(path) - 2:
                 marker_l += 1
-                dist_change_l = calc_distance_change(all_path_lengths, list_of_entangles, left_qubit, lattice_Graph.nodes[path[marker_l+1]]['qubit'], path[marker_l+1], QUBO_Graph)
+                dist_change_l = calc_distance_change(all_path_lengths, left_qubit, qubit_at_site[path[marker_l+1]], path[marker_l+1], state)
+                fresh_l = True
 
                 #print(f"The new left distance change is {dist_change_l}")
 
         # Swap the right qubit over, or it doesn't matter because the two are tied
         else:
-            swap_list.append((lattice_Graph.nodes[path[marker_r]]['qubit'], lattice_Graph.nodes[path[marker_r-1]]['qubit']))
-            swap_qubits(lattice_Graph, QUBO_Graph, path[marker_r], path[marker_r-1])
+            swap_list.append((qubit_at_site[path[marker_r]], move_label(state, path[marker_r-1])))
+            apply_swap(state, all_path_lengths, path[marker_r], path[marker_r-1], dist_change_r if fresh_r else None)
+            fresh_l = False
             swaps += 1
 
-            #print(f"The right qubit {lattice_Graph.nodes[path[marker_r]]['qubit']} will be swapped with {lattice_Graph.nodes[path[marker_r-1]]['qubit']}")
+            #print(f"The right qubit {qubit_at_site[path[marker_r]]} will be swapped with {qubit_at_site[path[marker_r-1]]}")
 
             if swaps < len(path) - 2:
                 marker_r -= 1
-                dist_change_r = calc_distance_change(all_path_lengths, list_of_entangles, right_qubit, lattice_Graph.nodes[path[marker_r-1]]['qubit'], path[marker_r-1], QUBO_Graph)
+                dist_change_r = calc_distance_change(all_path_lengths, right_qubit, qubit_at_site[path[marker_r-1]], path[marker_r-1], state)
+                fresh_r = True
 
                 #print(f"The new right distance change is {dist_change_r}")
     
 
-    return lattice_Graph, swaps, swap_list, list_of_entangles
-
-
-# Function that copies one graph onto another, for the purpose of resetting the graph
-def copy_graph(template, graph_to_reset):
-
-    # We only need to reset nodes, because all the information is in the nodes.
-    # The only information in the edges is the color of the edge in the QUBO graph
-    # to indicate entanglement
-    graph_to_reset.update(nodes=list(template.nodes(data=True)))
-
-    return(graph_to_reset)
+    return swaps, swap_list
 
 
 # Function that copies one graph onto another, for the purpose of resetting the graph
@@ -834,29 +1026,277 @@ def reconstruct_qubo(embeds, graph_to_construct):
     return(graph_to_construct)
 
 
+# This moves the two qubits at the ends of a path next to each other, with the left qubit doing the
+# first split swaps along the path and the right qubit doing the rest
+# It returns the swaps made, in the same form as perform_next_swap
+def route_path(state, all_path_lengths, path, split):
+
+    qubit_at_site = state.qubit_at_site
+    swap_list = []
+
+    for marker_l in range(split):
+        swap_list.append((qubit_at_site[path[marker_l]], move_label(state, path[marker_l+1])))
+        apply_swap(state, all_path_lengths, path[marker_l], path[marker_l+1])
+
+    for marker_r in range(-1, split - len(path) + 1, -1):
+        swap_list.append((qubit_at_site[path[marker_r]], move_label(state, path[marker_r-1])))
+        apply_swap(state, all_path_lengths, path[marker_r], path[marker_r-1])
+
+    return swap_list
+
+
+# This runs one trial like run_trial, but with a beam search instead of routing one entangle at a time
+# Every step, each of the beam_width best partial paths is carried on by routing each of its closest
+# pending entangles, split in every way between the two qubits, and then doing every entangle that is
+# possible after that. The partial paths are ranked by their swaps plus an estimate of the swaps they
+# still need, and ties are broken at random
+# The search stops once the best ranked path is finished
+def run_beam_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits, lower_bound, best_swap_num, truncate, beam_width, rng=random):
+
+    all_path_lengths = lattice_tables.dist_rows
+
+    # The starting position may already be unable to beat the best path
+    if lower_bound >= best_swap_num and truncate:
+        return False, 0, lower_bound
+
+    # Each partial path is its state, its moves, its swaps so far and the qubits it moved since the
+    # last entangling
+    beam = [(state.copy(), move_log.copy(), 0, moved_qubits)]
+
+    # The fewest swaps any of the paths that were cut off could have finished with
+    cut_swap_num = None
+
+    while beam[0][0].num_pending:
+
+        next_beam = []
+        seen = set()
+
+        for node_state, node_log, swap_num, node_moved in beam:
+
+            # Finished paths are kept as they are, in case none of the others beat them
+            if not node_state.num_pending:
+                next_beam.append((swap_num, rng.random(), node_state, node_log, swap_num, node_moved))
+                continue
+
+            site_of_qubit = node_state.site_of_qubit
+            cand_sites = []
+            shortest_swap_dist = 100000000
+
+            for entangle_id in node_state.pending_entangles():
+                entangle = node_state.entangles[entangle_id]
+                start, end = site_of_qubit[entangle[0]], site_of_qubit[entangle[1]]
+                dist = all_path_lengths[start][end]
+
+                if dist < shortest_swap_dist:
+                    cand_sites = [(start, end)]
+                    shortest_swap_dist = dist
+                elif dist == shortest_swap_dist:
+                    cand_sites.append((start, end))
+
+            for start, end in cand_sites:
+                path = lattice_tables.path(start, end)
+
+                for split in range(len(path) - 1):
+
+                    child_state = node_state.copy()
+                    swap_list = route_path(child_state, all_path_lengths, path, split)
+                    child_swaps = swap_num + len(swap_list)
+
+                    child_moved = node_moved | {qubit for qubit in chain.from_iterable(swap_list) if qubit >= 0}
+                    entangles_done, move_key = get_current_entangles(child_state, all_path_lengths, child_moved)
+
+                    # Different routes often end up in the same place, which only needs to be kept once
+                    child_key = (child_state.qubit_at_site.tobytes(), bytes(child_state.pending))
+                    if child_key in seen:
+                        continue
+                    seen.add(child_key)
+
+                    # Every swap brings the two qubits of at most two entangles one step closer, so about
+                    # half of what is left of the distance function is how many more swaps are needed
+                    extra_distance = child_state.total_distance - child_state.num_pending
+                    swaps_left = extra_distance / 2
+
+                    # Paths that can't beat the best path are dropped, but the bound is only worth working
+                    # out when it could matter, the same as in run_trial
+                    if truncate and child_swaps + max(-(-extra_distance // 2), lattice_diameter - 1) >= best_swap_num:
+                        child_bound = calc_swap_lower_bound(child_state, all_path_lengths)
+
+                        if child_swaps + child_bound >= best_swap_num:
+                            if cut_swap_num is None or child_swaps + child_bound < cut_swap_num:
+                                cut_swap_num = child_swaps + child_bound
+                            continue
+
+                    child_log = node_log.copy()
+                    child_log.extend_same(swap_list, "s")
+                    child_log.extend(entangles_done, move_key)
+
+                    next_beam.append((child_swaps + swaps_left, rng.random(), child_state, child_log, child_swaps,
+                                      free_swapped_qubits(entangles_done, move_key)))
+
+        # Every path was cut off, so the trial can't beat the best path
+        if not next_beam:
+            return False, cut_swap_num, cut_swap_num
+
+        next_beam.sort(key=lambda node: node[:2])
+        beam = [node[2:] for node in next_beam[:beam_width]]
+
+    best_state, best_log, swap_num = beam[0][:3]
+
+    state.restore(best_state)
+    move_log.restore(best_log)
+
+    return True, swap_num, swap_num
+
+
+# This runs one trial, carrying on from the starting position and initial moves already in the state
+# and move log, and adds every move it makes to the log
+# moved_qubits are the qubits moved by free swaps in the initial entangling, and lower_bound is the
+# fewest swaps the starting position could still need
+# If truncate is on, the trial is stopped as soon as it can't beat best_swap_num
+# It returns whether the trial finished, how many swaps it did, and the swap number recorded for it,
+# which for a trial that was stopped is the fewest swaps it could have finished with
+# router is "greedy" to route one random closest entangle at a time, or "beam" for a beam search
+# that keeps the beam_width best partial paths
+def run_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits, lower_bound, best_swap_num, truncate, rng=random, router="greedy", beam_width=8):
+
+    if router == "beam":
+        return run_beam_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits, lower_bound, best_swap_num, truncate, beam_width, rng)
+
+    all_path_lengths = lattice_tables.dist_rows
+    swap_num = 0
+
+    # The initial entangling may already have done everything
+    solved = not state.num_pending
+
+    # This is what gets recorded for the trial if it is cut short
+    trial_swap_num = swap_num
+
+    while not solved:
+
+        # If the swaps so far plus the fewest swaps that could still be needed can't beat
+        # the best path, this trial is never going to be the best, so stop it
+        if swap_num + lower_bound >= best_swap_num and truncate:
+            trial_swap_num = swap_num + lower_bound
+            break
+
+        # Do the swaps
+        new_swaps, new_swap_list = perform_next_swap(lattice_tables, state, all_path_lengths, rng)
+        swap_num += new_swaps
+        move_log.extend_same(new_swap_list, "s")
+        # Empty sites are recorded with negative labels, which aren't qubits
+        moved_qubits.update(qubit for qubit in chain.from_iterable(new_swap_list) if qubit >= 0)
+
+        # If we have already gone past the best swap num, immediately stop
+        if swap_num >= best_swap_num and truncate:
+            trial_swap_num = swap_num
+            break
+
+        # Get the current entanglements
+        entangles_done, move_key = get_current_entangles(state, all_path_lengths, moved_qubits)
+        #print(entangles_done)
+        move_log.extend(entangles_done, move_key)
+        moved_qubits = free_swapped_qubits(entangles_done, move_key)
+        
+        # If all the entanglments are done, quit
+        if not state.num_pending:
+            solved = True
+            #print(f"Finished solving attempt {i + 1} - {swap_num} swap_num")
+        elif truncate:
+            # The bound can never be more than half of the distance function minus one for
+            # each pending entangle, or one less than the longest distance on the lattice,
+            # so it is only worth working out when that could matter
+            max_lower_bound = max(-(-(state.total_distance - state.num_pending) // 2), lattice_diameter - 1)
+            if swap_num + max_lower_bound >= best_swap_num:
+                lower_bound = calc_swap_lower_bound(state, all_path_lengths)
+            else:
+                lower_bound = 0
+
+    if solved:
+        trial_swap_num = swap_num
+
+    return solved, swap_num, trial_swap_num
+
+
+# Returns whether a search that started at start_time has run out of time or been cancelled
+# cancel is anything with an is_set() method, like a threading or multiprocessing Event
+def search_stopped(start_time, time_limit, cancel):
+
+    if cancel is not None and cancel.is_set():
+        return True
+
+    return time_limit is not None and time.perf_counter() - start_time >= time_limit
+
+
 # This is the code to iterate through trial graphs to find the best solution
+# With a time limit or a cancel event, it is an anytime search: it stops between trials once the
+# time is up or it is cancelled, and returns the best path found so far. It always carries on
+# until there is at least one path though. iterations can then be None, for no limit
+# progress is called with the swap number, seconds so far and iteration number of every new best path
+# With a threshold quantile, init_entangles_frac and init_graph_dist are where the thresholds start,
+# and they then move to let about that fraction of starting positions through
+# trial_allocation is "fixed" to give every starting position the same number of trials, or "halving"
+# to share them out between a pool of starting positions by successive halving
+# router is "greedy" or "beam", with beam_width partial paths kept by the beam search, as in run_trial
+# With batch_trials, every starting position gets that many greedy trials, which are all run at once with TrialBatch
 def iterate_through(lattice_Graph, 
                     QUBO_Graph, 
                     iterations, 
                     no_truncate,
                     init_entangles_frac,
                     init_graph_dist,
+                    shared_best=None,
+                    seed=None,
+                    lattice_tables=None,
+                    objective="swaps",
+                    placement_search="random",
+                    time_limit=None,
+                    progress=None,
+                    cancel=None,
+                    threshold_quantile=None,
+                    dedupe_layouts=False,
+                    trial_allocation="fixed",
+                    router="greedy",
+                    beam_width=8,
+                    batch_trials=None,
                     ):
 
-    # First thing to do is save all the original variables
-    original_QUBO = copy.deepcopy(QUBO_Graph)
-    original_lattice = copy.deepcopy(lattice_Graph)
+    start_time = time.perf_counter()
+
+    if iterations is None:
+        iterations = math.inf
+
+    # A seed makes the whole run repeatable, without touching the global random state
+    # Without one, the random module is used as it always has been
+    if seed is None:
+        rng = random
+    else:
+        rng = random.Random(seed)
+
+    # The graphs themselves are never changed while solving, all of the placements are
+    # done on an embedding state, and the best one is handed back to be reconstructed
+    empty_state = EmbeddingState.for_graphs(lattice_Graph, QUBO_Graph)
+
+    # The state being solved is only made once, and is reset by copying other states into it
+    state = empty_state.copy()
+
     best_lattice_nodes = []
     best_qubo_embed = []
 
-    # Path length between all pairs of nodes
-    all_path_lengths = dict(nx.all_pairs_shortest_path_length(original_lattice))
+    # Path length and next step between all pairs of nodes
+    # These only depend on the lattice, so they can be passed in when many graphs are solved on it,
+    # and a lattice from import_lattice already has them
+    if lattice_tables is None:
+        lattice_tables = lattice_Graph.graph.get('lattice_tables')
+    if lattice_tables is None:
+        lattice_tables = LatticeTables(lattice_Graph)
+    all_path_lengths = lattice_tables.dist_rows
+    lattice_diameter = int(lattice_tables.dist.max())
 
     # Then, get the variables for the process
     total_iter_num = 0
     list_of_swap_nums = []
-    best_move_list = []
     best_swap_num = 10000000 # temporary impossibly high number
+    best_depth = 10000000
     overflow_strikes = 0 # How many times the generator can fail to generate a good graph before the program quits
 
     # Variables for testing things
@@ -866,158 +1306,489 @@ def iterate_through(lattice_Graph,
     ave_swap_list = []
     attempts_array = []
 
+    if threshold_quantile is None:
+        thresholds = None
+    else:
+        thresholds = AdaptiveThresholds(threshold_quantile, init_entangles_frac, init_graph_dist)
+
     # Set variable of how many times it runs each test graph
     num_trials = max(min(10, iterations // 5), 1)
 
-    while total_iter_num < iterations:
+    # Batches only pay off with a lot of trials, so with batches every starting position gets a whole batch
+    if batch_trials and router == "greedy":
+        num_trials = batch_trials
+
+    # Starting positions that are the same as one already tried, up to the symmetries of the lattice,
+    # get fewer trials
+    if dedupe_layouts:
+        layout_cache = LayoutCache(lattice_tables.automorphisms())
+    else:
+        layout_cache = None
+
+    # Every trial writes its moves into the same log, and the best one is kept as a slice of it
+    move_log = MoveLog()
+    best_move_log = MoveLog(0)
+
+    # The objective is either the fewest swaps, or the fewest layers of gates and swaps with the
+    # fewest swaps breaking ties
+    # A trial with more swaps can still be shallower, so trials are only truncated on the swap number
+    # when that is all that matters
+    truncate = not no_truncate and objective == "swaps"
+
+    # Free swaps mean that a graph could in principle be finished without any swaps, so this is
+    # the lowest the swap number can go. Once it is reached, there is no point carrying on
+    # Bounds from the graph alone, like a qubit with more partners than a site has neighbors, or more
+    # entangles than a placement can put next to each other, don't hold with free swaps. C17_204 has
+    # both and still needs no swaps on the Hex lattice, so the search only ends early at zero
+    # A path with no swaps can still be made shallower, so this doesn't apply to the depth
+    global_lower_bound = 0
+
+    # Trials are either given out evenly, with num_trials for every starting position, or by successive
+    # halving. Then a pool of starting positions each get one trial, the better half of them get two
+    # more, the better half of those get four more, and so on until only one is left
+    if trial_allocation == "halving":
+        pool_size = 8
+    else:
+        pool_size = 1
+
+    # Everything needed to run trials on each starting position in the pool
+    # The states and logs are made once and copied into for every new starting position
+    pool = [{"start_state": empty_state.copy(),
+             "template_state": empty_state.copy(),
+             "initial_moves": MoveLog()} for i in range(pool_size)]
+
+    stopped = False
+
+    while total_iter_num < iterations and not stopped and (best_swap_num > global_lower_bound or objective == "depth"):
         #print(f"Beginning run {total_iter_num} with a new graph")
 
-        # We should only generate graphs that would work well, so don't break out of this
-        # loop until we have one that does
-        # Once we find a graph that works well, we'll just run that graph a bunch of times
-        attempts = 0
+        # The starting positions that were made this time round, which is all of the pool unless the
+        # time ran out while making them
+        filled = []
 
-        while True:
+        for template in pool:
+
+            # With no path yet, once the time is up the positions already made are solved straight away
+            if filled and search_stopped(start_time, time_limit, cancel):
+                break
 
-            # Refresh everything
-            QUBO_Graph = copy_graph(original_QUBO, QUBO_Graph)
-            entangles_to_do = list(QUBO_Graph.edges)
-            lattice_Graph = copy_graph(original_lattice, lattice_Graph)
-            solved = False
-            swap_num = 0
+            # We should only generate graphs that would work well, so don't break out of this
+            # loop until we have one that does
+            # Once we find a graph that works well, we'll just run that graph a bunch of times
+            attempts = 0
 
-            # Map to the lattice
-            lattice_Graph, QUBO_Graph = place_initial_qubits(lattice_Graph, QUBO_Graph)
-            lattice_Graph, QUBO_Graph = place_green_qubits(lattice_Graph, QUBO_Graph)
+            while True:
 
-            #graph_dist = calc_graph_total_distance(QUBO_Graph, all_path_lengths, entangles_to_do)
-            #print(f"The graph distance before adjustments is {graph_dist}")
+                # When running in parallel, the other workers may have found a better path
+                if shared_best is not None and objective == "swaps":
+                    best_swap_num = min(best_swap_num, shared_best.value)
 
-            lattice_Graph, QUBO_Graph = distance_adjustments(lattice_Graph, QUBO_Graph, all_path_lengths)
+                # Bad starting positions can take a long time to get through, so the search can stop
+                # while making them too, once there is a path to hand back
+                if search_stopped(start_time, time_limit, cancel) and best_swap_num < 10000000:
+                    stopped = True
+                    break
+
+                # Refresh everything
+                state.restore(empty_state)
 
-            #graph_dist = calc_graph_total_distance(QUBO_Graph, all_path_lengths, entangles_to_do)
-            #print(f"The graph distance after adjustments is {graph_dist}")
+                # Map to the lattice
+                state = place_initial_qubits(QUBO_Graph, state, rng)
+                state = place_green_qubits(lattice_Graph, QUBO_Graph, state)
 
-            # We have to save this for when it finds the best path
-            # However, the only important parts of the graph that we need are the nodes
-            start_lattice_nodes = copy.copy([value for node, value in lattice_Graph.nodes(data="qubit")])
-            start_qubo_embed = copy.copy([value for node, value in QUBO_Graph.nodes(data="embedded")])
-            #print(start_lattice_nodes)
+                # Start the running distance function of the graph off
+                state.total_distance = calc_graph_total_distance(state, lattice_tables.dist)
+                #print(f"The graph distance before adjustments is {state.total_distance}")
 
-            # Do initial entangling
-            lattice_Graph, QUBO_Graph, entangles_to_do, entangles_done, move_key = get_current_entangles(lattice_Graph, QUBO_Graph, entangles_to_do, all_path_lengths)
-            original_move_list = entangles_done
-            original_move_list_key = move_key
+                # The starting position is improved either by trying random swaps, by always doing the
+                # best swap until there are none left that help, or with a tabu search
+                if placement_search == "steepest":
+                    state = steepest_descent(state, lattice_tables.dist)
+                elif placement_search == "tabu":
+                    state = tabu_search(state, lattice_tables, rng)
+                else:
+                    state = distance_adjustments(QUBO_Graph, state, all_path_lengths, rng)
 
-            graph_dist = calc_graph_total_distance(QUBO_Graph, all_path_lengths, entangles_to_do)
-            #print(f"The total graph distance of this graph is {graph_dist}")
+                #print(f"The graph distance after adjustments is {state.total_distance}")
 
-            # If not enough entanglements were made with the intial configuration, end the attempt
-            if (num_entangles - len(entangles_to_do))/num_entangles >= init_entangles_frac and graph_dist <= init_graph_dist:
+                # We have to save this for when it finds the best path
+                template["start_state"].restore(state)
 
-                #print(f"A good graph was found after {attempts} attempts on iteration {total_iter_num}")
-                attempts_array.append(attempts)
+                # Do initial entangling
+                entangles_done, move_key = get_current_entangles(state, all_path_lengths)
+                template["initial_moves"].truncate(0)
+                template["initial_moves"].extend(entangles_done, move_key)
+                template["moved_qubits"] = free_swapped_qubits(entangles_done, move_key)
+                template["lower_bound"] = calc_swap_lower_bound(state, all_path_lengths)
 
-                # These arrays store useful information for determining the scalers above
-                init_entangles_value = num_entangles - len(entangles_to_do)
-                init_entangles.append(init_entangles_value)
-                graph_distance_list.append(graph_dist)
+                graph_dist = state.total_distance
+                #print(f"The total graph distance of this graph is {graph_dist}")
 
-                template_QUBO = copy.deepcopy(QUBO_Graph)
-                template_lattice = copy.deepcopy(lattice_Graph)
-                template_entangles_to_do = copy.copy(entangles_to_do)
+                # If not enough entanglements were made with the intial configuration, end the attempt
+                entangles_frac = (num_entangles - state.num_pending)/num_entangles
 
-                break
+                if thresholds is None:
+                    good_graph = entangles_frac >= init_entangles_frac and graph_dist <= init_graph_dist
+                else:
+                    thresholds.add_candidate(entangles_frac, graph_dist)
+                    good_graph = thresholds.accepts(entangles_frac, graph_dist)
+
+                # If the time is up before there is any path, the next position is solved whatever the
+                # thresholds say, so that there is one as soon as possible
+                if not good_graph and best_swap_num >= 10000000 and search_stopped(start_time, time_limit, cancel):
+                    good_graph = True
+
+                if good_graph:
+
+                    #print(f"A good graph was found after {attempts} attempts on iteration {total_iter_num}")
+                    attempts_array.append(attempts)
 
+                    template["template_state"].restore(state)
+                    template["graph_dist"] = graph_dist
+                    template["entangles_frac"] = entangles_frac
+                    template["init_entangles"] = num_entangles - state.num_pending
 
-            elif attempts > 99:
+                    break
+
+
+                elif attempts > 99:
+
+                    # The adaptive thresholds go back to the fixed ones instead of giving up
+                    if thresholds is not None and (thresholds.entangles_frac > init_entangles_frac or thresholds.graph_dist < init_graph_dist):
+                        thresholds.relax()
+                        attempts = 0
+
+                    elif overflow_strikes >= 3:
+                    
+                        print("Could not find a good graph with 100 attempts.")
+                        print("This means that the restrictions placed on the graph generation process are "
+                            "too constrictive.")
+                        print("It is recommended that the initial entanglements scalar and/or the "
+                            "graph distance scalar be increased using the -ef and/or -gs arguments.")
+                        print("Exiting program...\n")
+                        quit()
+                    else:
+                        overflow_strikes += 1
+                        attempts = 0
 
-                if overflow_strikes >= 3:
-                
-                    print("Could not find a good graph with 100 attempts.")
-                    print("This means that the restrictions placed on the graph generation process are "
-                        "too constrictive.")
-                    print("It is recommended that the initial entanglements scalar and/or the "
-                        "graph distance scalar be increased using the -ef and/or -gs arguments.")
-                    print("Exiting program...\n")
-                    quit()
                 else:
-                    overflow_strikes += 1
-                    attempts = 0
+                    attempts += 1
+
+            if stopped:
+                break
 
+            # Gets information on how many moves it takes to solve
+            # scores is what the positions are ranked on, which is the swap number, or the depth and
+            # then the swap number
+            template["swap_nums"] = []
+            template["scores"] = []
+
+            # A repeated position's budget depends on how its earlier trials did against the best so far
+            # With halving, the most a position can get is the trials of every round
+            if layout_cache is not None:
+                template["layout_key"] = layout_cache.key(template["start_state"].qubit_at_site)
+                template["num_trials"] = layout_cache.trial_budget(template["layout_key"],
+                                                                   2 * pool_size - 1 if trial_allocation == "halving" else num_trials,
+                                                                   best_swap_num if objective == "swaps" and best_swap_num < 10000000 else None)
             else:
-                attempts += 1
+                template["num_trials"] = num_trials
+
+            filled.append(template)
+
+        # The positions made before the search stopped never got any trials, so there is nothing to record
+        if stopped:
+            break
+
+        survivors = filled
+        round_trials = 1
+
+        while True:
+
+            for template in survivors:
+
+                start_state = template["start_state"]
 
-        # Keeps track of how many times the graph has been tested
-        graph_iter_num = 0
+                # A repeated position with a small budget drops out of the rounds once it is used up
+                if trial_allocation == "halving" and layout_cache is not None:
+                    graph_trials = min(round_trials, template["num_trials"] - len(template["swap_nums"]))
+                elif trial_allocation == "halving":
+                    graph_trials = round_trials
+                else:
+                    graph_trials = template["num_trials"]
+
+                # All of the trials on the position can be run at once, as one batch
+                batch = None
+
+                if batch_trials and router == "greedy":
+                    num_batch_trials = min(graph_trials, iterations - total_iter_num)
+
+                    if num_batch_trials > 0 and not (search_stopped(start_time, time_limit, cancel) and best_swap_num < 10000000):
+
+                        if shared_best is not None and objective == "swaps":
+                            best_swap_num = min(best_swap_num, shared_best.value)
+
+                        batch = TrialBatch(lattice_tables, template["template_state"], template["initial_moves"], num_batch_trials, rng)
+                        batch_solved, batch_swap_nums, batch_trial_swap_nums = batch.run(best_swap_num, truncate)
+
+                # Now we run the candidate graph a hundred times
+                for graph_iter_num in range(graph_trials):
+                    #print(f"Beginning trial {graph_iter_num} in iteration {total_iter_num}")
+
+                    if total_iter_num >= iterations or (best_swap_num <= global_lower_bound and objective == "swaps"):
+                        break
+
+                    if batch is not None:
+
+                        # The batch was made smaller if there weren't enough iterations left for all of the trials
+                        if graph_iter_num >= len(batch_solved):
+                            break
+
+                        solved = bool(batch_solved[graph_iter_num])
+                        swap_num = int(batch_swap_nums[graph_iter_num])
+                        trial_swap_num = int(batch_trial_swap_nums[graph_iter_num])
 
-        # Gets information on how many moves it takes to solve
-        moves_to_solve = []
+                        # Only the moves of finished trials are ever looked at
+                        if solved:
+                            trial_log = batch.move_log(graph_iter_num)
 
-        # Now we run the candidate graph a hundred times
-        while graph_iter_num < num_trials:
-            #print(f"Beginning trial {graph_iter_num} in iteration {total_iter_num}")
+                    else:
+
+                        # There is a path to hand back once the best swap number is no longer the impossibly high
+                        # one, which may be from another worker
+                        if search_stopped(start_time, time_limit, cancel) and best_swap_num < 10000000:
+                            stopped = True
+                            break
 
-            # Refresh everything
-            QUBO_Graph = copy_graph(template_QUBO, QUBO_Graph)
-            entangles_to_do = copy.copy(template_entangles_to_do)
-            lattice_Graph = copy_graph(template_lattice, lattice_Graph)
-            solved = False
-            swap_num = 0
-            move_list = copy.copy(original_move_list)
-            move_list_key = copy.copy(original_move_list_key)
+                        # Refresh everything
+                        state.restore(template["template_state"])
+                        move_log.restore(template["initial_moves"])
+                        moved_qubits = set(template["moved_qubits"])
 
-            while not solved:
+                        # When running in parallel, the other workers may have found a better path
+                        if shared_best is not None and objective == "swaps":
+                            best_swap_num = min(best_swap_num, shared_best.value)
 
-                # Do the swaps
-                lattice_Graph, new_swaps, new_swap_list, entangles_to_do = perform_next_swap(lattice_Graph, QUBO_Graph, entangles_to_do, all_path_lengths)
-                swap_num += new_swaps
-                move_list += new_swap_list
-                move_list_key.extend(["s" for swap in new_swap_list])
+                        solved, swap_num, trial_swap_num = run_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits,
+                                                                     template["lower_bound"], best_swap_num, truncate, rng, router, beam_width)
+                        trial_log = move_log
 
-                # If we have already gone past the best swap num, immediately stop
-                if swap_num >= best_swap_num and not no_truncate:
+                    # Stuff done after the graphs are finished
+                    list_of_swap_nums.append(trial_swap_num)
+                    template["swap_nums"].append(trial_swap_num)
+
+                    #print(f"\nThis trial took {swap_num} moves to solve")
+         
+                    if solved and objective == "depth":
+                        trial_depth = calc_depth(start_state.lattice_nodes(), trial_log.move_list(), trial_log.move_key())
+                        new_best = (trial_depth, swap_num) < (best_depth, best_swap_num)
+                        template["scores"].append((trial_depth, swap_num))
+                    elif objective == "depth":
+                        new_best = False
+                        template["scores"].append((10000000, trial_swap_num))
+                    else:
+                        new_best = solved and swap_num < best_swap_num
+                        template["scores"].append(trial_swap_num)
+
+                    if new_best:
+                        best_swap_num = swap_num
+                        best_move_log = trial_log.copy()
+                        best_lattice_nodes = start_state.lattice_nodes()
+                        best_qubo_embed = start_state.qubo_embeds()
+
+                        if shared_best is not None and objective == "swaps":
+                            with shared_best.get_lock():
+                                shared_best.value = min(shared_best.value, swap_num)
+                        #print("\n\n\n")
+                        #print("Best Move List: \n")
+                        #print(best_move_log.move_list())
+                        #print("\n\nBest Move Key: \n")
+                        #print(best_move_log.move_key())
+
+                        if objective == "depth":
+                            best_depth = trial_depth
+                            print(f"A new best path was found, with a depth of {trial_depth} and {swap_num} swaps on iteration {total_iter_num}")
+                        else:
+                            print(f"A new best path was found, with {swap_num} swaps on iteration {total_iter_num}")
+
+                        if progress is not None:
+                            progress(swap_num, time.perf_counter() - start_time, total_iter_num)
+
+                    total_iter_num += 1
+                    #print(f"The sequence {move_log.move_list()} with key {move_log.move_key()} has {swap_num} swaps")
+
+                if stopped:
                     break
 
-                # Get the current entanglements
-                lattice_Graph, QUBO_Graph, entangles_to_do, entangles_done, move_key = get_current_entangles(lattice_Graph, QUBO_Graph, entangles_to_do, all_path_lengths)
-                #print(entangles_done)
-                move_list.extend(entangles_done)
-                move_list_key.extend(move_key)
-                
-                # If all the entanglments are done, quit
-                if not entangles_to_do:
-                    solved = True
-                    #print(f"Finished solving attempt {i + 1} - {swap_num} swap_num")
-
-            # Stuff done after the graphs are finished
-            list_of_swap_nums.append(swap_num)
-            moves_to_solve.append(swap_num)
-
-            #print(f"\nThis trial took {swap_num} moves to solve")
- 
-            if swap_num < best_swap_num:
-                best_swap_num = copy.deepcopy(swap_num)
-                best_move_list = copy.deepcopy(move_list)
-                best_move_key = copy.deepcopy(move_list_key)
-                best_lattice_nodes = copy.deepcopy(start_lattice_nodes)
-                best_qubo_embed = copy.deepcopy(start_qubo_embed)
-                #print("\n\n\n")
-                #print("Best Move List: \n")
-                #print(best_move_list)
-                #print("\n\nBest Move Key: \n")
-                #print(best_move_key)
-
-                print(f"A new best path was found, with {swap_num} swaps on iteration {total_iter_num + graph_iter_num}")
-
-            graph_iter_num += 1
-            #print(f"The sequence {move_list} with key {move_list_key} has {swap_num} swaps")
-        
-        total_iter_num += num_trials
+            if trial_allocation != "halving" or len(survivors) == 1 or stopped or total_iter_num >= iterations:
+                break
+
+            # Nothing can beat a path that meets the lower bound, so there is no next round
+            if best_swap_num <= global_lower_bound and objective == "swaps":
+                break
 
-        ave_swaps = np.average(np.array(moves_to_solve))
-        ave_swap_list.append(ave_swaps)
-        #print(f"\tThe average number of swap to solve this graph is {ave_swaps}")
+            # The better half of the positions go on to the next round, ranked by their best trial
+            # and then their average
+            # A position with no trials goes last, with a score of the same type as the others, and so
+            # does a repeated position that has used up its budget
+            no_score = 10000000 if objective == "swaps" else (10000000, 10000000)
+            survivors = sorted(survivors, key=lambda template: (layout_cache is not None and len(template["swap_nums"]) >= template["num_trials"],
+                                                                min(template["scores"], default=no_score),
+                                                                np.average(template["swap_nums"]) if template["swap_nums"] else 10000000))
+            survivors = survivors[:len(survivors) // 2]
+            round_trials *= 2
+
+        if best_swap_num <= global_lower_bound and objective == "swaps":
+            print(f"No path can have fewer than {global_lower_bound} swaps, so the search was ended early")
+
+        for template in filled:
+
+            # The search can be stopped before any trials of the last graph
+            # These arrays store useful information for determining the scalers above, with one entry
+            # for every graph that was solved
+            if template["swap_nums"]:
+                ave_swaps = np.average(np.array(template["swap_nums"]))
+                ave_swap_list.append(ave_swaps)
+                init_entangles.append(template["init_entangles"])
+                graph_distance_list.append(template["graph_dist"])
+
+                if thresholds is not None:
+                    thresholds.add_solved(template["entangles_frac"], template["graph_dist"], ave_swaps)
+
+            if layout_cache is not None:
+                layout_cache.add_trials(template["layout_key"], template["swap_nums"])
+
+            #print(f"\tThe average number of swap to solve this graph is {ave_swaps}")
     
     print(f"The average number of bad graphs that were generated is {np.average(np.array(attempts_array))}")
-    return best_move_list, best_move_key, list_of_swap_nums, best_lattice_nodes, best_qubo_embed, total_iter_num, graph_distance_list, init_entangles, ave_swap_list, attempts_array
\ No newline at end of file
+    if layout_cache is not None:
+        print(f"{layout_cache.num_repeats} of the starting positions were the same as one already tried, "
+              f"up to the symmetries of the lattice")
+    if thresholds is not None:
+        print(f"The thresholds ended at an initial entangles fraction of {round(thresholds.entangles_frac, ndigits=3)} "
+              f"and a graph distance of {thresholds.graph_dist}")
+    return best_move_log.move_list(), best_move_log.move_key(), list_of_swap_nums, best_lattice_nodes, best_qubo_embed, total_iter_num, graph_distance_list, init_entangles, ave_swap_list, attempts_array
+
+
+"""
+Functions to Run in Parallel
+"""
+
+
+# These are the best swap number found by any worker, the event that cancels the search and the
+# progress callback, which are set up when each worker starts
+_shared_best = None
+_cancel = None
+_progress = None
+
+
+# Ctrl+C is left to the main process, which cancels the workers through the cancel event, so the
+# workers can hand back their best paths instead of being interrupted
+def _init_worker(shared_best, cancel, progress):
+
+    global _shared_best, _cancel, _progress
+    _shared_best = shared_best
+    _cancel = cancel
+    _progress = progress
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# This is what each worker runs
+# Every worker gets its own seed, so they don't all try the same placements
+def _iterate_through_worker(worker_args):
+
+    seed, lattice_Graph, QUBO_Graph, iterations, no_truncate, init_entangles_frac, init_graph_dist, objective, placement_search, time_limit, threshold_quantile, dedupe_layouts, trial_allocation, router, beam_width, batch_trials = worker_args
+
+    # quit() would kill the worker without the pool noticing, so pass it back instead
+    try:
+        return iterate_through(lattice_Graph, QUBO_Graph, iterations, no_truncate,
+                               init_entangles_frac, init_graph_dist, shared_best=_shared_best, seed=seed,
+                               objective=objective, placement_search=placement_search,
+                               time_limit=time_limit, progress=_progress, cancel=_cancel,
+                               threshold_quantile=threshold_quantile, dedupe_layouts=dedupe_layouts,
+                               trial_allocation=trial_allocation, router=router, beam_width=beam_width,
+                               batch_trials=batch_trials)
+    except SystemExit:
+        return None
+
+
+# This splits the iterations between a number of worker processes that each run
+# iterate_through on their own placements
+# The workers share the best swap number, so a trial is truncated as soon as it is no better
+# than the best path found by any of them
+# It returns the same things as iterate_through, with the results of the workers merged
+# Every worker gets the time limit and the progress callback, which they call with their own
+# iteration numbers. To cancel the workers, cancel has to be a multiprocessing Event
+def iterate_through_parallel(lattice_Graph,
+                             QUBO_Graph,
+                             iterations,
+                             no_truncate,
+                             init_entangles_frac,
+                             init_graph_dist,
+                             workers,
+                             seed=None,
+                             objective="swaps",
+                             placement_search="random",
+                             time_limit=None,
+                             progress=None,
+                             cancel=None,
+                             threshold_quantile=None,
+                             dedupe_layouts=False,
+                             trial_allocation="fixed",
+                             router="greedy",
+                             beam_width=8,
+                             batch_trials=None,
+                             ):
+
+    # Fork is used where it is available, because the main script isn't safe to import again
+    if "fork" in mp.get_all_start_methods():
+        context = mp.get_context("fork")
+    else:
+        context = mp.get_context()
+
+    shared_best = context.Value('i', 10000000)
+
+    # Independent seeds for each worker, which are all picked from the given seed if there is one
+    seeds = np.random.SeedSequence(seed).generate_state(workers, dtype=np.uint64).tolist()
+
+    # With no limit on the iterations, every worker runs until the time is up or it is cancelled
+    if iterations is None:
+        worker_iterations = [None] * workers
+    else:
+        worker_iterations = [iterations // workers + (1 if i < iterations % workers else 0) for i in range(workers)]
+
+    worker_args = [(seeds[i], lattice_Graph, QUBO_Graph, worker_iterations[i], no_truncate, init_entangles_frac,
+                    init_graph_dist, objective, placement_search, time_limit, threshold_quantile, dedupe_layouts, trial_allocation, router, beam_width, batch_trials) for i in range(workers) if worker_iterations[i] != 0]
+
+    with context.Pool(len(worker_args), initializer=_init_worker, initargs=(shared_best, cancel, progress)) as pool:
+        results = pool.map(_iterate_through_worker, worker_args)
+
+    if None in results:
+        print("Exiting program...\n")
+        quit()
+
+    # The best path is from whichever worker found the fewest swaps, or the shallowest path
+    # Workers that never beat the shared best have no path at all
+    solved_results = [result for result in results if result[1]]
+
+    if objective == "depth":
+        best_result = min(solved_results, key=lambda result: (calc_depth(result[3], result[0], result[1]), result[1].count("s")))
+    else:
+        best_result = min(solved_results, key=lambda result: result[1].count("s"))
+
+    list_of_swap_nums = []
+    total_iter_num = 0
+    graph_distance_list = []
+    init_entangles = []
+    ave_swap_list = []
+    attempts_array = []
+
+    for result in results:
+        list_of_swap_nums += result[2]
+        total_iter_num += result[5]
+        graph_distance_list += result[6]
+        init_entangles += result[7]
+        ave_swap_list += result[8]
+        attempts_array += result[9]
+
+    return best_result[0], best_result[1], list_of_swap_nums, best_result[3], best_result[4], total_iter_num, graph_distance_list, init_entangles, ave_swap_list, attempts_array
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import random
+
+import numpy as np
+
+"""
+Local search over the starting position of the qubits
+
+Improving a starting position is a quadratic assignment problem: every qubit is given a
+lattice site, and the cost is the sum of the lattice distances between the qubits that
+need to be entangled, which is the distance function of the graph.
+
+Instead of trying random pairs of qubits, the change in the distance function from
+swapping every pair of placed qubits is worked out at once as a matrix with numpy.
+With F the matrix of which qubits need to be entangled and B the lattice distances
+between the placed qubits, the change from swapping qubits r and s is
+
+    G[r, s] + G[s, r] - G[r, r] - G[s, s] + 2 F[r, s] B[r, s],   where G = F B
+
+Swapping two qubits only changes rows and columns r and s of B, so G is kept up to date
+after every swap instead of being worked out again.
+
+Two searches use these. Steepest descent stops at the first local minimum, while the
+robust tabu search (Taillard, 1991) keeps going from there by taking the best move that
+doesn't put qubits straight back where they just were. The tabu search also lets qubits
+move onto the empty sites next to the layout, which are treated as qubits that don't
+need to be entangled with anything.
+"""
+
+
+"""
+Swap Deltas
+"""
+
+
+# This finds the placed qubits, their sites, which of them need to be entangled and the
+# lattice distances between them, which is everything the local search works with
+# The qubits are numbered by their index in qubits, not by their label
+# Any empty sites given are added on the end as qubits with no entangles
+def make_placement_arrays(state, dist_matrix, empty_sites=()):
+
+    site_of_qubit = state.site_of_qubit_view()
+    qubits = np.flatnonzero(site_of_qubit != -1)
+    sites = np.concatenate((site_of_qubit[qubits], empty_sites)).astype(np.intp)
+
+    index_of = np.full(len(site_of_qubit), -1, dtype=np.intp)
+    index_of[qubits] = np.arange(len(qubits))
+
+    # Only the entangles that are still left to do count towards the distance function
+    entangles = index_of[state.entangle_array[state.pending_mask()]]
+
+    interactions = np.zeros((len(sites), len(sites)), dtype=np.int32)
+    interactions[entangles[:, 0], entangles[:, 1]] = 1
+    interactions[entangles[:, 1], entangles[:, 0]] = 1
+
+    qubit_dists = dist_matrix[np.ix_(sites, sites)].astype(np.int32)
+
+    return sites, interactions, qubit_dists
+
+
+# This gives the change in the distance function from swapping every pair of qubits, where
+# products is interactions @ qubit_dists
+def calc_swap_deltas(interactions, qubit_dists, products):
+
+    diagonal = np.diagonal(products)
+
+    return products + products.T - diagonal[:, None] - diagonal[None, :] + 2 * interactions * qubit_dists
+
+
+# This swaps two qubits in the placement arrays and updates the products to match
+def swap_placement(sites, interactions, qubit_dists, products, r, s):
+
+    sites[[r, s]] = sites[[s, r]]
+
+    old_rows = qubit_dists[[r, s]]
+
+    # Swapping the sites of the two qubits swaps their rows and columns of the distances
+    qubit_dists[[r, s]] = qubit_dists[[s, r]]
+    qubit_dists[:, [r, s]] = qubit_dists[:, [s, r]]
+
+    # Rows r and s of the distances changed, which changes every column of the products by the
+    # same amount, apart from columns r and s, which are worked out again
+    products += interactions[:, [r, s]] @ (qubit_dists[[r, s]] - old_rows)
+    products[:, [r, s]] = interactions @ qubit_dists[:, [r, s]]
+
+
+"""
+Local Searches
+"""
+
+
+# This keeps doing whichever swap of two placed qubits lowers the distance function the most,
+# until no swap lowers it at all, which is a true 2-opt local minimum
+# The distance function only ever goes down, so this always finishes
+def steepest_descent(state, dist_matrix):
+
+    sites, interactions, qubit_dists = make_placement_arrays(state, dist_matrix)
+    num_qubits = len(sites)
+
+    if num_qubits < 2:
+        return state
+
+    products = interactions @ qubit_dists
+
+    while True:
+
+        deltas = calc_swap_deltas(interactions, qubit_dists, products)
+
+        r, s = divmod(int(np.argmin(deltas)), num_qubits)
+        dist_change = int(deltas[r, s])
+
+        if dist_change >= 0:
+            break
+
+        #print(f"The qubits on sites {sites[r]} and {sites[s]} will be swapped, "
+        #        f"because the distance change is {dist_change}")
+
+        state.swap(int(sites[r]), int(sites[s]))
+        state.total_distance += dist_change
+
+        swap_placement(sites, interactions, qubit_dists, products, r, s)
+
+    return state
+
+
+# This finds the empty sites next to the placed qubits, which the tabu search can move them onto
+def find_empty_neighbors(state, lattice_tables):
+
+    qubit_at_site = state.qubit_at_site
+
+    return sorted({next_site for site in range(len(qubit_at_site)) if qubit_at_site[site] != -1
+                   for next_site in lattice_tables.neighbors[site] if qubit_at_site[next_site] == -1})
+
+
+# This improves the placement with a robust tabu search, and puts the qubits where they were in
+# the best placement it found
+# Every step does the swap that lowers the distance function the most, or raises it the least,
+# out of the swaps that aren't tabu. Once a qubit leaves a site it can't go back to it for a
+# random number of steps around the number of qubits, unless that would give the best placement yet
+# A swap is only tabu if it would put both qubits back on sites they just left
+def tabu_search(state, lattice_tables, rng=random, iterations=None):
+
+    # The qubits are the first num_qubits entries of the placement arrays, in order of their labels
+    qubits = np.flatnonzero(state.site_of_qubit_view() != -1)
+    num_qubits = len(qubits)
+
+    sites, interactions, qubit_dists = make_placement_arrays(state, lattice_tables.dist, find_empty_neighbors(state, lattice_tables))
+    num_sites = len(sites)
+
+    if num_qubits < 2:
+        return state
+
+    if iterations is None:
+        iterations = 20 * num_qubits
+
+    products = interactions @ qubit_dists
+
+    # Swapping a site with itself or two empty sites does nothing, so those are never picked
+    never = np.eye(num_sites, dtype=bool)
+    never[num_qubits:, num_qubits:] = True
+
+    # tabu_until[i, site] is the step until which qubit i can't be put back on that lattice site
+    tabu_until = np.zeros((num_sites, lattice_tables.num_sites), dtype=np.int64)
+
+    min_tenure = max(int(0.9 * num_sites), 1)
+    max_tenure = max(int(1.1 * num_sites), min_tenure)
+
+    total_distance = state.total_distance
+    best_distance = total_distance
+    best_sites = sites.copy()
+
+    for step in range(iterations):
+
+        deltas = calc_swap_deltas(interactions, qubit_dists, products)
+
+        tabu = tabu_until[:, sites] > step
+        tabu &= tabu.T
+
+        # A tabu swap is still allowed if it would give the best placement so far
+        allowed = ~never & (~tabu | (total_distance + deltas < best_distance))
+
+        if not allowed.any():
+            break
+
+        r, s = divmod(int(np.argmin(np.where(allowed, deltas, np.iinfo(np.int32).max))), num_sites)
+
+        tabu_until[r, sites[r]] = step + rng.randint(min_tenure, max_tenure)
+        tabu_until[s, sites[s]] = step + rng.randint(min_tenure, max_tenure)
+
+        total_distance += int(deltas[r, s])
+        swap_placement(sites, interactions, qubit_dists, products, r, s)
+
+        if total_distance < best_distance:
+            best_distance = total_distance
+            best_sites = sites.copy()
+
+    # Put the qubits back where they were in the best placement
+    for site in sites.tolist():
+        state.qubit_at_site[site] = -1
+    for qubit, site in zip(qubits.tolist(), best_sites[:num_qubits].tolist()):
+        state.place(site, qubit)
+
+    state.total_distance = best_distance
+
+    return state
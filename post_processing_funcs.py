@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+from schedule_funcs import calc_move_sites
+
+"""
+Functions to clean up the best path once the search is over
+
+The search only turns a gate into a gate with a free swap when it can see that the swap
+helps straight away, so the best path can still have swaps that could have been done for
+free. Since a gate acts the same way on both of its qubits, swapping the two qubits just
+before or just after their gate does the same thing as a gate with a free swap.
+
+The moves are replayed to find the two lattice sites each one acts on. When two moves in a
+row on a pair of sites are on exactly the same two sites, with nothing else on either site
+in between, they are combined:
+    a swap and a swap undo each other, so both go
+    a gate and a swap, either way round, become a gate with a free swap
+    a free swap and a swap, either way round, become just the gate
+The moves in between don't touch either site, so none of them change.
+
+The new path is replayed again to check that every move is between neighbouring sites and
+every entangle is done exactly once, and the original path is kept if it isn't.
+"""
+
+
+# This finds the moves to drop and the new key of every move, by going through the moves with a
+# stack of the moves still kept on each site
+def combine_moves(lattice_nodes, move_list, move_key):
+
+    move_sites = calc_move_sites(lattice_nodes, move_list, move_key)
+    new_key = list(move_key)
+    dropped = [False] * len(move_key)
+
+    site_moves = [[] for site in range(len(lattice_nodes))]
+
+    for move_num, (site1, site2) in enumerate(move_sites):
+
+        key = new_key[move_num]
+        last_move = site_moves[site1][-1] if site_moves[site1] else None
+
+        # The last move on both sites has to be the same move, and nothing on either site can have
+        # happened since
+        if last_move is not None and site_moves[site2] and site_moves[site2][-1] == last_move and "s" in (key, new_key[last_move]):
+
+            last_key = new_key[last_move]
+
+            # Two swaps undo each other
+            if key == "s" and last_key == "s":
+                dropped[last_move] = True
+                dropped[move_num] = True
+
+            # The swap goes into the gate, and the gate is kept wherever it was
+            elif last_key == "s":
+                dropped[last_move] = True
+                new_key[move_num] = "f" if key == "g" else "g"
+
+            else:
+                dropped[move_num] = True
+                new_key[last_move] = "f" if last_key == "g" else "g"
+
+            if dropped[last_move]:
+                site_moves[site1].pop()
+                site_moves[site2].pop()
+
+            # When the swap after a gate goes into it, the gate stays as the last move on both sites
+            if dropped[move_num]:
+                continue
+
+        site_moves[site1].append(move_num)
+        site_moves[site2].append(move_num)
+
+    return dropped, new_key
+
+
+# Returns whether the moves are a full path: every move is between neighbouring sites and
+# every entangle of the QUBO graph is done exactly once
+def check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key):
+
+    entangles = {frozenset(edge) for edge in QUBO_Graph.edges}
+    done = set()
+
+    for (qubit1, qubit2), key, (site1, site2) in zip(move_list, move_key, calc_move_sites(lattice_nodes, move_list, move_key)):
+
+        if not lattice_Graph.has_edge(site1, site2):
+            return False
+
+        if key != "s":
+            entangle = frozenset((qubit1, qubit2))
+
+            if entangle not in entangles or entangle in done:
+                return False
+
+            done.add(entangle)
+
+    return done == entangles
+
+
+# This gives the path with the swaps combined, as a new move list and key
+# If the new path doesn't check out, the original one is given back
+def post_process_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key):
+
+    dropped, new_key = combine_moves(lattice_nodes, move_list, move_key)
+
+    new_move_list = [move for move, drop in zip(move_list, dropped) if not drop]
+    new_move_key = [key for key, drop in zip(new_key, dropped) if not drop]
+
+    if not check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, new_move_list, new_move_key):
+        #print("The post processed path didn't check out, so the original one is used")
+        return list(move_list), list(move_key)
+
+    return new_move_list, new_move_key
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+"""
+Functions to schedule a move list into layers that run at the same time
+
+On the quantum computer, gates and swaps on different qubits can run at the same time, so
+how long a path takes to run depends on its depth, the number of layers it needs, rather
+than on the number of moves.
+
+The moves are replayed from the starting position to find which lattice sites each one
+acts on, and every move is put in the first layer after the last move on either of its
+sites. That keeps the moves on each site in the same order, so the layers do exactly the
+same thing as the move list. A gate with a free swap is one move, because the swap is
+combined with the gate.
+"""
+
+
+# Swaps with an empty lattice site record the site instead of a qubit, as -1 - site, so
+# that the site can be told apart from the qubits and found again when replaying the moves
+def empty_site_label(site):
+
+    return -1 - site
+
+
+# This finds the two lattice sites every move acts on, given the lattice in the form used by
+# reconstruct_lattice, which is the qubit on each site or -1
+def calc_move_sites(lattice_nodes, move_list, move_key):
+
+    qubit_at_site = list(lattice_nodes)
+    site_of_qubit = {qubit: site for site, qubit in enumerate(qubit_at_site) if qubit != -1}
+
+    move_sites = []
+
+    for (qubit1, qubit2), key in zip(move_list, move_key):
+
+        site1 = site_of_qubit[qubit1]
+        site2 = site_of_qubit[qubit2] if qubit2 >= 0 else -1 - qubit2
+
+        move_sites.append((site1, site2))
+
+        # Swaps and free swaps move the qubits
+        if key != "g":
+            qubit_at_site[site1], qubit_at_site[site2] = qubit_at_site[site2], qubit_at_site[site1]
+
+            site_of_qubit[qubit1] = site2
+            if qubit2 >= 0:
+                site_of_qubit[qubit2] = site1
+
+    return move_sites
+
+
+# This finds the layer every move goes in
+def calc_move_layers(lattice_nodes, move_list, move_key):
+
+    # The number of layers that already have a move on each site
+    site_depth = [0] * len(lattice_nodes)
+
+    move_layers = []
+
+    for site1, site2 in calc_move_sites(lattice_nodes, move_list, move_key):
+
+        layer = max(site_depth[site1], site_depth[site2])
+        site_depth[site1] = layer + 1
+        site_depth[site2] = layer + 1
+
+        move_layers.append(layer)
+
+    return move_layers
+
+
+# Returns the number of layers the moves need
+def calc_depth(lattice_nodes, move_list, move_key):
+
+    return max(calc_move_layers(lattice_nodes, move_list, move_key), default=-1) + 1
+
+
+# This packs the moves into layers, where each layer is a list of the indices of the moves in it
+def schedule_moves(lattice_nodes, move_list, move_key):
+
+    move_layers = calc_move_layers(lattice_nodes, move_list, move_key)
+
+    layers = [[] for layer in range(max(move_layers, default=-1) + 1)]
+    for move_num, layer in enumerate(move_layers):
+        layers[layer].append(move_num)
+
+    return layers
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import optimization_funcs as ofs
+from embedding_state import EmbeddingState
+from move_log import MoveLog
+
+"""
+Things the tests share
+
+A starting position is made the same way iterate_through makes one: the qubits are placed,
+moved around by the random distance adjustments, and then every entangle that is already
+next to each other is done.
+"""
+
+
+# This reads a QUBO graph from a file in the repo, with the green qubits found
+def load_qubo_graph(filename):
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        QUBO_Graph, num_nodes, num_edges, list_nodes = ofs.make_qubo_graph(os.path.join(repo_dir, filename))
+
+    return ofs.find_greens(QUBO_Graph)
+
+
+# This makes a starting position and returns the state before the initial entangles, the state
+# after them, the initial moves and the qubits that the initial free swaps moved
+def make_start(lattice_Graph, QUBO_Graph, seed):
+
+    rng = random.Random(seed)
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+
+    state = EmbeddingState.for_graphs(lattice_Graph, QUBO_Graph)
+    state = ofs.place_initial_qubits(QUBO_Graph, state, rng)
+    state = ofs.place_green_qubits(lattice_Graph, QUBO_Graph, state)
+    state.total_distance = ofs.calc_graph_total_distance(state, lattice_tables.dist)
+    state = ofs.distance_adjustments(QUBO_Graph, state, lattice_tables.dist_rows, rng)
+
+    start_state = state.copy()
+
+    entangles_done, move_key = ofs.get_current_entangles(state, lattice_tables.dist_rows)
+    initial_moves = MoveLog()
+    initial_moves.extend(entangles_done, move_key)
+
+    return start_state, state, initial_moves, ofs.free_swapped_qubits(entangles_done, move_key)
+
+
+# The lattices are only made once for all of the tests
+@pytest.fixture(scope="session")
+def lattices():
+
+    return {lattice_geo: ofs.import_lattice(lattice_geo) for lattice_geo in ("HHex", "Hex")}
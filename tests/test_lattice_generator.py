@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import lattice_generator
+
+"""
+Tests for the generated lattices
+
+The number of sites is worked out without building the lattice, so it is checked against the
+lattices that are built, including the three sizes of IBM's devices. Every lattice has to be in
+one piece, and no site can have more than three neighbors on either architecture.
+"""
+
+lattice_sizes = [("HHex", 1), ("HHex", 3), ("HHex", 6), ("HHex", 10), ("Hex", 1), ("Hex", 2), ("Hex", 5), ("Hex", 12)]
+
+
+# This checks the sites of each generated lattice, and that it is connected with degrees of at most 3
+@pytest.mark.parametrize("lattice_geo, k", lattice_sizes)
+def test_generated_lattice(lattice_geo, k):
+
+    positions, edges = lattice_generator.build_lattice(lattice_geo, k)
+
+    num_sites = lattice_generator.lattice_num_sites(lattice_geo, k)
+    assert len(positions) == num_sites
+
+    lattice_Graph = nx.Graph()
+    lattice_Graph.add_nodes_from(range(num_sites))
+    lattice_Graph.add_edges_from(np.asarray(edges).tolist())
+
+    assert lattice_Graph.number_of_nodes() == num_sites
+    assert lattice_Graph.number_of_edges() == len(edges)
+    assert nx.is_connected(lattice_Graph)
+    assert max(degree for site, degree in lattice_Graph.degree()) <= 3
+
+    # No two sites are drawn in the same place
+    assert len({tuple(position) for position in np.asarray(positions).tolist()}) == num_sites
+
+
+# The heavy hex lattices for k = 3, 6 and 10 are the Eagle, Osprey and Condor layouts
+@pytest.mark.parametrize("k, num_sites", [(3, 127), (6, 433), (10, 1121)])
+def test_ibm_device_sizes(k, num_sites):
+
+    assert lattice_generator.lattice_num_sites("HHex", k) == num_sites
+    assert len(lattice_generator.build_lattice("HHex", k)[0]) == num_sites
+
+
+# The smallest lattice picked for a number of qubits has room for them, and the one before it doesn't
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("num_qubits", [1, 50, 127, 128, 500, 1121])
+def test_smallest_lattice_size(lattice_geo, num_qubits):
+
+    k = lattice_generator.smallest_lattice_size(lattice_geo, num_qubits)
+
+    assert lattice_generator.lattice_num_sites(lattice_geo, k) >= num_qubits
+    assert k == 1 or lattice_generator.lattice_num_sites(lattice_geo, k - 1) < num_qubits
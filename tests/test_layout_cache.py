@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import os
+import random
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+from networkx.algorithms.isomorphism import GraphMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lattice_generator
+import optimization_funcs as ofs
+from layout_cache import LayoutCache
+
+"""
+Tests for the lattice symmetries and the canonical keys of the starting positions
+
+Every key the layout cache makes depends on the automorphisms of the lattice being exactly right,
+so they are checked against the ones networkx finds with VF2, on the shipped lattices and on
+small generated ones.
+"""
+
+
+# This gives the tables of a shipped lattice, or of a generated one when k is given
+def load_tables(lattice_geo, k):
+
+    if k is None:
+        return ofs.import_lattice(lattice_geo).graph['lattice_tables']
+
+    return lattice_generator.load_generated_tables(lattice_geo, k)
+
+
+lattices = [("HHex", None), ("Hex", None), ("HHex", 1), ("HHex", 2), ("Hex", 2), ("Hex", 3)]
+
+
+# This checks that the automorphisms are the same ones VF2 finds, with every site going to the same place
+@pytest.mark.parametrize("lattice_geo, k", lattices)
+def test_automorphisms_match_vf2(lattice_geo, k):
+
+    lattice_tables = load_tables(lattice_geo, k)
+
+    lattice_Graph = nx.Graph()
+    lattice_Graph.add_nodes_from(range(lattice_tables.num_sites))
+    lattice_Graph.add_edges_from(lattice_tables.edges)
+
+    vf2_automorphisms = {tuple(mapping[site] for site in range(lattice_tables.num_sites))
+                         for mapping in GraphMatcher(lattice_Graph, lattice_Graph).isomorphisms_iter()}
+    automorphisms = [tuple(automorphism) for automorphism in lattice_tables.automorphisms().tolist()]
+
+    assert len(automorphisms) == len(set(automorphisms))
+    assert set(automorphisms) == vf2_automorphisms
+
+
+# This checks that a starting position has the same key after every rotation and reflection of the
+# lattice, and that moving one qubit onto another site changes it
+@pytest.mark.parametrize("lattice_geo, k", lattices)
+def test_symmetric_layouts_share_a_key(lattice_geo, k):
+
+    lattice_tables = load_tables(lattice_geo, k)
+    automorphisms = lattice_tables.automorphisms()
+    layout_cache = LayoutCache(automorphisms)
+
+    rng = random.Random(0)
+    num_sites = lattice_tables.num_sites
+
+    for trial in range(5):
+
+        qubit_at_site = np.full(num_sites, -1, dtype=np.int16)
+        sites = rng.sample(range(num_sites), num_sites // 3)
+        qubit_at_site[sites] = np.arange(len(sites))
+
+        key = layout_cache.key(qubit_at_site)
+
+        for automorphism in automorphisms:
+            moved = np.full(num_sites, -1, dtype=np.int16)
+            moved[automorphism] = qubit_at_site
+
+            assert layout_cache.key(moved) == key
+
+        # Putting qubit 0 on an empty site next to it gives a different position, unless a symmetry
+        # of the lattice does the same thing
+        empty_neighbors = [site for site in lattice_tables.neighbors[sites[0]] if qubit_at_site[site] == -1]
+
+        if empty_neighbors:
+            moved = qubit_at_site.copy()
+            moved[sites[0]], moved[empty_neighbors[0]] = -1, 0
+
+            same_position = any((moved[automorphism] == qubit_at_site).all() for automorphism in automorphisms)
+            assert (layout_cache.key(moved) == key) == same_position
+
+
+# This checks that a repeated position gets its trials from how its earlier trials did
+def test_trial_budget_uses_swap_stats():
+
+    layout_cache = LayoutCache(np.arange(4)[None, :])
+
+    assert layout_cache.trial_budget("worse", 8, 3) == 8
+    layout_cache.add_trials("worse", [5, 6, 7])
+    assert layout_cache.trial_budget("best", 8, 3) == 8
+    layout_cache.add_trials("best", [3, 3, 3])
+    assert layout_cache.trial_budget("untried", 8, 3) == 8
+
+    assert layout_cache.swap_stats("worse") == (5, 6)
+    assert layout_cache.swap_stats("untried") is None
+
+    # The position that found the best path keeps twice what halving would give it, and the one
+    # that never got there only gets one trial
+    assert layout_cache.trial_budget("best", 8, 3) == 8
+    assert layout_cache.trial_budget("worse", 8, 3) == 1
+
+    # Without any swaps to go on, or without a best path, the budget is just halved
+    assert layout_cache.trial_budget("untried", 8, 3) == 4
+    assert layout_cache.trial_budget("worse", 8) == 2
+    assert layout_cache.num_repeats == 4
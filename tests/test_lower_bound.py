@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import glob
+import os
+import random
+
+import pytest
+
+import optimization_funcs as ofs
+from conftest import load_qubo_graph, make_start, repo_dir
+from schedule_funcs import calc_move_sites
+
+"""
+Tests for the lower bound on the swaps a trial still needs
+
+Trials are cut short on this bound, so it must never be more than the swaps that are actually
+left. Every path a full trial finds is replayed from the start, and the bound of the state
+before every move is checked against the swaps still to come in that path.
+"""
+
+test_graphs = sorted(os.path.relpath(filepath, repo_dir) for filepath in glob.glob(os.path.join(repo_dir, "test_graphs", "*.txt")))
+
+
+# This checks the bound against the swaps left at every point of the paths of untruncated trials
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", test_graphs)
+def test_lower_bound_never_exceeds_swaps_left(lattices, lattice_geo, filename):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    lattice_diameter = int(lattice_tables.dist.max())
+    QUBO_Graph = load_qubo_graph(filename)
+
+    for seed in range(3):
+
+        start_state, state, initial_moves, moved_qubits = make_start(lattice_Graph, QUBO_Graph, seed)
+        lower_bound = ofs.calc_swap_lower_bound(state, lattice_tables.dist_rows)
+
+        move_log = initial_moves.copy()
+        solved, swap_num, trial_swap_num = ofs.run_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits,
+                                                         lower_bound, 10000000, False, random.Random(seed))
+
+        assert solved
+        assert lower_bound <= swap_num
+
+        # Every entangle is looked up by its pair of qubits, in either order
+        entangle_ids = {frozenset(entangle): entangle_id for entangle_id, entangle in enumerate(start_state.entangles)}
+
+        replay_state = start_state.copy()
+        move_list = move_log.move_list()
+        move_key = move_log.move_key()
+        swaps_left = move_key.count("s")
+
+        for (qubit1, qubit2), key, (site1, site2) in zip(move_list, move_key, calc_move_sites(start_state.lattice_nodes(), move_list, move_key)):
+
+            assert ofs.calc_swap_lower_bound(replay_state, lattice_tables.dist_rows) <= swaps_left
+
+            if key != "s":
+                replay_state.complete_entangle(entangle_ids[frozenset((qubit1, qubit2))])
+            if key != "g":
+                replay_state.swap(site1, site2)
+            if key == "s":
+                swaps_left -= 1
+
+        assert replay_state.num_pending == 0
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+import optimization_funcs as ofs
+from conftest import load_qubo_graph, make_start
+from placement_funcs import (calc_swap_deltas, find_empty_neighbors, make_placement_arrays, steepest_descent,
+                             swap_placement, tabu_search)
+
+"""
+Tests for the swap delta matrix of the placement searches
+
+Every entry of the delta matrix is checked against working out the whole distance function again
+after doing that swap, both for a new placement and after the matrix has been kept up to date
+through a run of swaps. The empty sites the tabu search can move qubits onto are included.
+"""
+
+inputs = ["graph.txt", "test_graphs/Harder_25_node.txt", "test_circuits/4gt4-v0_72.qasm"]
+
+
+# This works out the distance function of the placement arrays from scratch
+def calc_placement_distance(sites, interactions, dist_matrix):
+
+    return int((interactions * dist_matrix[np.ix_(sites, sites)]).sum()) // 2
+
+
+# This checks every entry of the delta matrix against the distance function after doing that swap
+def check_deltas(sites, interactions, qubit_dists, products, dist_matrix):
+
+    deltas = calc_swap_deltas(interactions, qubit_dists, products)
+    distance = calc_placement_distance(sites, interactions, dist_matrix)
+
+    for r in range(len(sites)):
+        for s in range(len(sites)):
+            swapped_sites = sites.copy()
+            swapped_sites[[r, s]] = swapped_sites[[s, r]]
+
+            assert deltas[r, s] == calc_placement_distance(swapped_sites, interactions, dist_matrix) - distance
+
+
+# This checks the deltas of a new placement, and again after each of a run of swaps
+# With empty_sites, the empty sites next to the placement are added on, as in the tabu search
+@pytest.mark.parametrize("empty_sites", [False, True])
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", inputs)
+def test_swap_deltas_match_recompute(lattices, lattice_geo, filename, empty_sites):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    dist_matrix = np.asarray(lattice_tables.dist)
+
+    start_state = make_start(lattice_Graph, load_qubo_graph(filename), 0)[0]
+
+    sites, interactions, qubit_dists = make_placement_arrays(start_state, dist_matrix,
+                                                             find_empty_neighbors(start_state, lattice_tables) if empty_sites else ())
+    products = interactions @ qubit_dists
+
+    assert calc_placement_distance(sites, interactions, dist_matrix) == start_state.total_distance
+
+    check_deltas(sites, interactions, qubit_dists, products, dist_matrix)
+
+    rng = random.Random(0)
+
+    for step in range(5):
+        r, s = rng.sample(range(len(sites)), 2)
+        swap_placement(sites, interactions, qubit_dists, products, r, s)
+
+        assert (qubit_dists == dist_matrix[np.ix_(sites, sites)]).all()
+        assert (products == interactions @ qubit_dists).all()
+
+        check_deltas(sites, interactions, qubit_dists, products, dist_matrix)
+
+
+# This checks that both searches leave the state with the distance function it really has, and
+# never make it worse
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", inputs)
+def test_searches_keep_total_distance(lattices, lattice_geo, filename):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+
+    start_state = make_start(lattice_Graph, load_qubo_graph(filename), 0)[0]
+
+    steepest_state = steepest_descent(start_state.copy(), lattice_tables.dist)
+    tabu_state = tabu_search(start_state.copy(), lattice_tables, random.Random(0))
+
+    for state in (steepest_state, tabu_state):
+        assert state.total_distance == ofs.calc_graph_total_distance(state, lattice_tables.dist)
+        assert state.total_distance <= start_state.total_distance
+
+        # Every qubit is still on exactly one site
+        placed = [qubit for qubit in state.qubit_at_site if qubit != -1]
+        assert sorted(placed) == sorted(qubit for qubit in start_state.qubit_at_site if qubit != -1)
+        assert all(state.qubit_at_site[state.site_of_qubit[qubit]] == qubit for qubit in placed)
+
+    # Steepest descent only swaps placed qubits, so the same sites are used
+    assert sorted(steepest_state.site_of_qubit) == sorted(start_state.site_of_qubit)
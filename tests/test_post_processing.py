@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import random
+
+import pytest
+
+import optimization_funcs as ofs
+from conftest import load_qubo_graph, make_start
+from post_processing_funcs import check_moves, post_process_moves
+
+"""
+Tests for cleaning up the paths after the search
+
+Whatever post_process_moves gives back has to be a full path that check_moves passes, with no
+more swaps than the path it was given.
+"""
+
+inputs = ["graph.txt", "test_graphs/Harder_25_node.txt", "test_graphs/24_node_test.txt", "test_circuits/4gt4-v0_72.qasm"]
+
+
+# This runs full trials and checks the post processed paths
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", inputs)
+def test_post_processed_paths_check_out(lattices, lattice_geo, filename):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    lattice_diameter = int(lattice_tables.dist.max())
+    QUBO_Graph = load_qubo_graph(filename)
+
+    for seed in range(5):
+
+        start_state, state, move_log, moved_qubits = make_start(lattice_Graph, QUBO_Graph, seed)
+        lower_bound = ofs.calc_swap_lower_bound(state, lattice_tables.dist_rows)
+
+        ofs.run_trial(lattice_tables, lattice_diameter, state, move_log, moved_qubits, lower_bound, 10000000, False, random.Random(seed))
+
+        lattice_nodes = start_state.lattice_nodes()
+        move_list = move_log.move_list()
+        move_key = move_log.move_key()
+
+        assert check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key)
+
+        new_move_list, new_move_key = post_process_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key)
+
+        assert check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, new_move_list, new_move_key)
+        assert new_move_key.count("s") <= move_key.count("s")
+        assert len(new_move_key) - new_move_key.count("s") == QUBO_Graph.number_of_edges()
+
+
+# This puts swaps that undo each other and a swap next to a gate into a path, and checks that
+# they are all taken out again
+def test_redundant_swaps_are_removed(lattices):
+
+    lattice_Graph = lattices["Hex"]
+    QUBO_Graph = load_qubo_graph("graph.txt")
+
+    start_state, state, move_log, moved_qubits = make_start(lattice_Graph, QUBO_Graph, 0)
+    lattice_nodes = start_state.lattice_nodes()
+
+    # Two qubits next to each other that are entangled, and two that are just next to each other
+    entangled = next((qubit1, qubit2) for qubit1, qubit2 in QUBO_Graph.edges
+                     if lattice_Graph.has_edge(start_state.site_of_qubit[qubit1], start_state.site_of_qubit[qubit2]))
+    neighbors = next((lattice_nodes[site1], lattice_nodes[site2]) for site1, site2 in lattice_Graph.edges
+                     if lattice_nodes[site1] != -1 and lattice_nodes[site2] != -1)
+
+    # Swapping the entangled qubits just before their gate is the same as a gate with a free swap
+    move_list = [neighbors, neighbors, entangled, entangled]
+    move_key = ["s", "s", "s", "g"]
+
+    # The rest of the gates are done from the swapped position, one by one along a path
+    rest_state = start_state.copy()
+    rest_state.swap(start_state.site_of_qubit[entangled[0]], start_state.site_of_qubit[entangled[1]])
+    rest_state.complete_entangle(next(entangle_id for entangle_id, entangle in enumerate(rest_state.entangles)
+                                      if set(entangle) == set(entangled)))
+
+    rest_log = move_log.copy()
+    rest_log.truncate(0)
+    entangles_done, rest_key = ofs.get_current_entangles(rest_state, lattice_Graph.graph['lattice_tables'].dist_rows)
+    rest_log.extend(entangles_done, rest_key)
+
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    ofs.run_trial(lattice_tables, int(lattice_tables.dist.max()), rest_state, rest_log, ofs.free_swapped_qubits(entangles_done, rest_key),
+                  0, 10000000, False, random.Random(0))
+
+    move_list += rest_log.move_list()
+    move_key += rest_log.move_key()
+
+    assert check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key)
+
+    new_move_list, new_move_key = post_process_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key)
+
+    assert check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, new_move_list, new_move_key)
+    assert new_move_key.count("s") <= move_key.count("s") - 3
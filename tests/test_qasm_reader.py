@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import glob
+import os
+
+import pytest
+
+import optimization_funcs as ofs
+from conftest import repo_dir
+
+"""
+Tests for reading the gates of QASM files without qiskit
+
+The built in reader has to give exactly the same gate pairs, in the same order, as loading the
+circuit in qiskit, and has to hand anything it doesn't understand back to qiskit.
+"""
+
+pytest.importorskip("qiskit")
+
+test_circuits = sorted(os.path.relpath(filepath, repo_dir) for filepath in glob.glob(os.path.join(repo_dir, "test_circuits", "*.qasm")))
+
+
+# This checks the reader against qiskit on every bundled circuit
+@pytest.mark.parametrize("filename", test_circuits)
+def test_reader_matches_qiskit(filename):
+
+    filepath = os.path.join(repo_dir, filename)
+
+    circuit_gates = ofs.read_qasm_gates(filepath)
+
+    assert circuit_gates is not None
+    assert circuit_gates == ofs.load_qasm_gates(filepath)
+
+
+# This checks that a file with a gate definition, a gate on a whole register and more than one
+# register is handed to qiskit, and still gives the right gates
+def test_unsupported_files_fall_back_to_qiskit(tmp_path):
+
+    filepath = tmp_path / "custom_gate.qasm"
+    filepath.write_text('OPENQASM 2.0;\n'
+                        'include "qelib1.inc";\n'
+                        'gate mycx a, b { cx a, b; }\n'
+                        'qreg q[3];\n'
+                        'qreg r[2];\n'
+                        'h q;\n'
+                        'mycx q[0], r[1];\n'
+                        'cx q[2], q[1]; // a comment, with a comma\n'
+                        'barrier q[0], q[1];\n')
+
+    assert ofs.read_qasm_gates(str(filepath)) is None
+    assert ofs.qasm_converter(str(filepath)) == [[0, 4], [1, 2]]
+
+
+# This checks the reader on a file it does understand, with comments, parameters with commas in them,
+# barriers and two registers
+def test_reader_numbers_qubits_across_registers(tmp_path):
+
+    filepath = tmp_path / "registers.qasm"
+    filepath.write_text('OPENQASM 2.0;\n'
+                        'include "qelib1.inc";\n'
+                        'qreg q[3];\n'
+                        'qreg r[2];\n'
+                        'u3(0.1, 0.2, 0.3) q[0];\n'
+                        'cx q[0], r[1]; // a comment, with a comma\n'
+                        'barrier q[0], q[1];\n'
+                        'cx q[2],\n  q[1];\n'
+                        'cx r[1], q[0];\n')
+
+    assert ofs.read_qasm_gates(str(filepath)) == [[0, 4], [1, 2]]
+    assert ofs.read_qasm_gates(str(filepath)) == ofs.load_qasm_gates(str(filepath))
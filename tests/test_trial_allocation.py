@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import optimization_funcs as ofs
+
+"""
+Smoke tests for sharing the trials out by successive halving
+
+4gt11_82 can be solved with no swaps at all, so the search reaches its lower bound part of the
+way through a round and some of the starting positions never get a trial.
+"""
+
+test_circuit = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_circuits", "4gt11_82.qasm")
+
+
+# This runs the search with halving and checks that it finds a path with every gate on it, which
+# has no swaps when the swaps are what is being kept down
+@pytest.mark.parametrize("objective", ["swaps", "depth"])
+def test_halving_reaches_lower_bound(objective):
+
+    QUBO_Graph, num_nodes, num_edges, list_nodes = ofs.make_qubo_graph(test_circuit)
+    QUBO_Graph = ofs.find_greens(QUBO_Graph)
+    lattice_Graph = ofs.import_lattice("Hex")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = ofs.iterate_through(lattice_Graph, QUBO_Graph, 100, False, 0.0, 10_000, seed=0,
+                                     objective=objective, trial_allocation="halving")
+
+    best_moves_key = result[1]
+    assert len(best_moves_key) - best_moves_key.count("s") == num_edges
+
+    if objective == "swaps":
+        assert best_moves_key.count("s") == 0
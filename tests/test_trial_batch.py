@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import random
+
+import pytest
+
+from conftest import load_qubo_graph, make_start
+from post_processing_funcs import check_moves
+from trial_batch import TrialBatch
+
+"""
+Tests for running a batch of trials at once
+
+Every trial in the batch keeps its own moves, so the path of every trial that finishes is
+checked from the starting position with check_moves, and its swaps are counted against the
+swap number the batch gave back for it. Truncated batches are checked the same way.
+"""
+
+inputs = ["graph.txt", "test_graphs/Harder_25_node.txt", "test_graphs/24_node_test.txt", "test_circuits/4gt4-v0_72.qasm"]
+
+
+# This checks the path and swap number of every finished trial in a batch
+def check_batch(lattice_Graph, QUBO_Graph, start_state, batch, solved, final_swap_nums):
+
+    lattice_nodes = start_state.lattice_nodes()
+
+    for trial in range(len(solved)):
+        if not solved[trial]:
+            continue
+
+        move_log = batch.move_log(trial)
+        move_list = move_log.move_list()
+        move_key = move_log.move_key()
+
+        assert check_moves(lattice_Graph, QUBO_Graph, lattice_nodes, move_list, move_key)
+        assert move_key.count("s") == final_swap_nums[trial]
+
+
+# This runs a batch without truncating and checks every trial finishes with a good path
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", inputs)
+def test_batch_trials_pass_check_moves(lattices, lattice_geo, filename):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    QUBO_Graph = load_qubo_graph(filename)
+
+    for seed in range(3):
+
+        start_state, state, initial_moves, moved_qubits = make_start(lattice_Graph, QUBO_Graph, seed)
+
+        batch = TrialBatch(lattice_tables, state, initial_moves, 20, random.Random(seed))
+        solved, final_swap_nums, trial_swap_nums = batch.run(10000000, False)
+
+        assert solved.all()
+        check_batch(lattice_Graph, QUBO_Graph, start_state, batch, solved, final_swap_nums)
+
+
+# This runs a truncated batch against a best path that some trials can't beat, and checks the
+# trials that do finish
+@pytest.mark.parametrize("lattice_geo", ["HHex", "Hex"])
+@pytest.mark.parametrize("filename", inputs)
+def test_truncated_batch_trials_pass_check_moves(lattices, lattice_geo, filename):
+
+    lattice_Graph = lattices[lattice_geo]
+    lattice_tables = lattice_Graph.graph['lattice_tables']
+    QUBO_Graph = load_qubo_graph(filename)
+
+    for seed in range(3):
+
+        start_state, state, initial_moves, moved_qubits = make_start(lattice_Graph, QUBO_Graph, seed)
+
+        full_swap_nums = TrialBatch(lattice_tables, state, initial_moves, 20, random.Random(seed)).run(10000000, False)[1]
+        best_swap_num = int(full_swap_nums.max())
+
+        batch = TrialBatch(lattice_tables, state, initial_moves, 20, random.Random(seed))
+        solved, final_swap_nums, trial_swap_nums = batch.run(best_swap_num, True)
+
+        # A trial only finishes if it beats the best path, and the best path only gets better as
+        # trials finish, so every trial that was cut short couldn't beat the best one at the end
+        assert (final_swap_nums[solved] < best_swap_num).all()
+        assert (trial_swap_nums[~solved] >= min(final_swap_nums[solved], default=best_swap_num)).all()
+
+        check_batch(lattice_Graph, QUBO_Graph, start_state, batch, solved, final_swap_nums)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18th
+
+@author: sambringman
+"""
+
+import random
+
+import numpy as np
+
+from move_log import MoveLog, op_codes
+from schedule_funcs import empty_site_label
+
+"""
+Batched trials on one starting position
+
+The trials on a starting position only differ in their random choices, but each of them is
+run on its own, one Python step at a time. Here a whole batch of trials is run at once
+instead. Every trial is one row of a set of numpy arrays (the qubit on every site, the site
+of every qubit, which entangles are still pending) and every step is done for all of the
+rows together:
+    every entangle whose qubits are next to each other is done, and the ones where swapping
+        the two qubits lowers the distance function get a free swap
+    every trial picks one of its closest pending entangles at random, and its two qubits are
+        moved towards each other along the next hop table, with whichever qubit gives the
+        lower distance change moving each time
+Trials that finish, or that can't beat the best path any more, are dropped from the arrays,
+so the rest of the batch gets smaller as it goes.
+
+This follows the same rules as run_trial, with two small differences. Each qubit takes its
+own next hop towards the other one instead of both following one path, and a qubit only gets
+one free swap per step, so no free swap ever has to be checked again.
+"""
+
+
+class TrialBatch:
+
+    def __init__(self, lattice_tables, state, initial_moves, num_trials, rng=random):
+
+        self.dist = lattice_tables.dist
+        self.next_hop = lattice_tables.next_hop
+
+        # Every batch gets its own numpy generator, seeded from the one the trials would have used
+        self.rng = np.random.default_rng(rng.getrandbits(64))
+
+        self.qubits1 = state.entangle_array[:, 0]
+        self.qubits2 = state.entangle_array[:, 1]
+        self.num_qubits = len(state.site_of_qubit)
+
+        # partner_qubits[qubit] and partner_ids[qubit] are the partners and entangle ids of a qubit,
+        # padded out to the most partners any qubit has, with has_partner marking the real ones
+        max_partners = max(max((len(partners) for partners in state.partners), default=0), 1)
+
+        self.partner_qubits = np.zeros((self.num_qubits, max_partners), dtype=np.intp)
+        self.partner_ids = np.zeros((self.num_qubits, max_partners), dtype=np.intp)
+        self.has_partner = np.zeros((self.num_qubits, max_partners), dtype=bool)
+
+        for qubit, partners in enumerate(state.partners):
+            for i, (partner, entangle_id) in enumerate(partners):
+                self.partner_qubits[qubit, i] = partner
+                self.partner_ids[qubit, i] = entangle_id
+                self.has_partner[qubit, i] = True
+
+        # Every trial still running is one row of these, and trials[row] is the number of its trial
+        self.trials = np.arange(num_trials)
+        self.site_of_qubit = np.tile(np.array(state.site_of_qubit, dtype=np.intp), (num_trials, 1))
+        self.qubit_at_site = np.tile(np.array(state.qubit_at_site, dtype=np.intp), (num_trials, 1))
+        self.pending = np.tile(state.pending_mask(), (num_trials, 1))
+        self.num_pending_of = np.tile(np.array(state.num_pending_of, dtype=np.intp), (num_trials, 1))
+        self.swap_nums = np.zeros(num_trials, dtype=np.intp)
+
+        # The moves of every trial, in the same form as MoveLog, starting with the initial moves
+        initial = np.frombuffer(initial_moves.moves, dtype=np.int16)[:3 * initial_moves.num_moves].reshape(-1, 3)
+
+        self.moves = np.zeros((num_trials, max(2 * len(initial), 64), 3), dtype=np.int16)
+        self.moves[:, :len(initial)] = initial
+        self.move_counts = np.full(num_trials, len(initial), dtype=np.intp)
+
+        # How every trial ended, the same as what run_trial returns
+        self.solved = np.zeros(num_trials, dtype=bool)
+        self.final_swap_nums = np.zeros(num_trials, dtype=np.intp)
+        self.trial_swap_nums = np.zeros(num_trials, dtype=np.intp)
+
+    # Runs every trial to the end, and returns whether each one finished, how many swaps it did, and
+    # the swap number recorded for it, as arrays
+    # With truncate on, a trial is stopped as soon as it can't beat the best path, which gets better
+    # as trials in the batch finish
+    def run(self, best_swap_num, truncate):
+
+        while len(self.trials):
+
+            self.entangle()
+
+            finished = ~self.pending.any(axis=1)
+
+            if truncate and finished.any():
+                best_swap_num = min(best_swap_num, int(self.swap_nums[finished].min()))
+
+            self.retire(finished, True, self.swap_nums)
+
+            if not len(self.trials):
+                break
+
+            if truncate:
+                swap_bounds = self.swap_nums + self.calc_lower_bounds(self.calc_entangle_dists()[2])
+                self.retire(swap_bounds >= best_swap_num, False, swap_bounds)
+
+                if not len(self.trials):
+                    break
+
+            self.route()
+
+            if truncate:
+                self.retire(self.swap_nums >= best_swap_num, False, self.swap_nums)
+
+        return self.solved, self.final_swap_nums, self.trial_swap_nums
+
+    # Returns the moves of a trial as a MoveLog
+    def move_log(self, trial):
+
+        return MoveLog.from_array(self.moves[trial, :self.move_counts[trial]])
+
+    # Drops the trials in the rows marked done, recording how they ended
+    def retire(self, done, solved, recorded_swap_nums):
+
+        if not done.any():
+            return
+
+        trials = self.trials[done]
+        self.solved[trials] = solved
+        self.final_swap_nums[trials] = self.swap_nums[done]
+        self.trial_swap_nums[trials] = recorded_swap_nums[done]
+
+        keep = ~done
+        self.trials = self.trials[keep]
+        self.site_of_qubit = self.site_of_qubit[keep]
+        self.qubit_at_site = self.qubit_at_site[keep]
+        self.pending = self.pending[keep]
+        self.num_pending_of = self.num_pending_of[keep]
+        self.swap_nums = self.swap_nums[keep]
+
+    # The lattice distance of every entangle in every trial still running
+    def calc_entangle_dists(self):
+
+        sites1 = self.site_of_qubit[:, self.qubits1]
+        sites2 = self.site_of_qubit[:, self.qubits2]
+
+        return sites1, sites2, self.dist[sites1, sites2]
+
+    # The same lower bound as the single entangle one in calc_swap_lower_bound, for every trial at once
+    def calc_lower_bounds(self, dists):
+
+        free_moves = self.num_pending_of[:, self.qubits1] + self.num_pending_of[:, self.qubits2] - 2
+        bounds = np.where(self.pending & (dists > 1), dists - 1 - free_moves, 0)
+
+        return np.maximum(bounds.max(axis=1), 0)
+
+    # This gives the change in the distance function of the trial in each row from swapping whatever is
+    # on sites1 and sites2, where qubits1 and qubits2 are on those sites, or -1 if a site is empty
+    # Like calc_distance_change, only the entangles of the two qubits are looked at
+    def calc_swap_deltas(self, rows, sites1, sites2, qubits1, qubits2):
+
+        deltas = self.calc_move_change(rows, qubits1, sites1, sites2, qubits2, np.ones(len(rows), dtype=bool))
+
+        return deltas + self.calc_move_change(rows, qubits2, sites2, sites1, qubits1, qubits2 != -1)
+
+    # The change in the distances to the pending partners of each qubit from moving it between the two
+    # sites, apart from the distance to the qubit it swaps with, which stays the same
+    # Rows where moved is False count for nothing
+    def calc_move_change(self, rows, qubits, from_sites, to_sites, other_qubits, moved):
+
+        partners = self.partner_qubits[qubits]
+        counted = (self.has_partner[qubits] & moved[:, None] & (partners != other_qubits[:, None])
+                   & self.pending[rows[:, None], self.partner_ids[qubits]])
+
+        partner_sites = self.site_of_qubit[rows[:, None], partners]
+        changes = self.dist[to_sites[:, None], partner_sites] - self.dist[from_sites[:, None], partner_sites]
+
+        return np.where(counted, changes, 0).sum(axis=1)
+
+    # Adds one move to the trial in each row, where a row can come up more than once as long as the
+    # rows are in order
+    def add_moves(self, rows, key, qubits1, qubits2):
+
+        if not len(rows):
+            return
+
+        trials = self.trials[rows]
+
+        # Moves for the same trial go one after another
+        positions = self.move_counts[trials] + np.arange(len(trials)) - np.searchsorted(trials, trials)
+
+        # Double the room when it runs out
+        if positions.max() >= self.moves.shape[1]:
+            moves = np.zeros((len(self.moves), 2 * (positions.max() + 1), 3), dtype=np.int16)
+            moves[:, :self.moves.shape[1]] = self.moves
+            self.moves = moves
+
+        self.moves[trials, positions, 0] = op_codes[key]
+        self.moves[trials, positions, 1] = qubits1
+        self.moves[trials, positions, 2] = qubits2
+
+        self.move_counts += np.bincount(trials, minlength=len(self.move_counts))
+
+    # Swaps whatever is on sites1 and sites2 in the trial in each row, where there is always a qubit on sites1
+    def swap_sites(self, rows, sites1, sites2):
+
+        qubits1 = self.qubit_at_site[rows, sites1]
+        qubits2 = self.qubit_at_site[rows, sites2]
+
+        self.qubit_at_site[rows, sites1] = qubits2
+        self.qubit_at_site[rows, sites2] = qubits1
+
+        self.site_of_qubit[rows, qubits1] = sites2
+
+        placed = qubits2 != -1
+        self.site_of_qubit[rows[placed], qubits2[placed]] = sites1[placed]
+
+    # Does every entangle that is possible in every trial, like get_current_entangles
+    def entangle(self):
+
+        sites1, sites2, dists = self.calc_entangle_dists()
+        rows, entangle_ids = np.nonzero(self.pending & (dists == 1))
+
+        if not len(rows):
+            return
+
+        qubits1 = self.qubits1[entangle_ids]
+        qubits2 = self.qubits2[entangle_ids]
+        sites1 = sites1[rows, entangle_ids]
+        sites2 = sites2[rows, entangle_ids]
+
+        self.pending[rows, entangle_ids] = False
+        np.subtract.at(self.num_pending_of, (rows, qubits1), 1)
+        np.subtract.at(self.num_pending_of, (rows, qubits2), 1)
+
+        # The gates that lower the distance function by swapping their qubits get a free swap
+        free = self.calc_swap_deltas(rows, sites1, sites2, qubits1, qubits2) < 0
+
+        # Only the first free swap of each qubit in a trial is kept, so none of them get in each other's way
+        free_ids = np.flatnonzero(free)
+        qubit_keys = np.stack((rows[free_ids] * self.num_qubits + qubits1[free_ids],
+                               rows[free_ids] * self.num_qubits + qubits2[free_ids]), axis=1).ravel()
+
+        first = np.zeros(len(qubit_keys), dtype=bool)
+        first[np.unique(qubit_keys, return_index=True)[1]] = True
+        free[free_ids] = first[0::2] & first[1::2]
+
+        # The gates are recorded before the free swaps, the same as get_current_entangles
+        gates = ~free
+        self.add_moves(rows[gates], "g", qubits1[gates], qubits2[gates])
+        self.add_moves(rows[free], "f", qubits1[free], qubits2[free])
+
+        self.swap_sites(rows[free], sites1[free], sites2[free])
+
+    # Brings the two qubits of one of the closest pending entangles next to each other in every trial,
+    # like perform_next_swap
+    def route(self):
+
+        sites1, sites2, dists = self.calc_entangle_dists()
+        rows = np.arange(len(self.trials))
+
+        dists = np.where(self.pending, dists, np.iinfo(np.int16).max)
+        shortest = dists.min(axis=1)
+
+        # One of the closest entangles is picked at random
+        picks = np.where(dists == shortest[:, None], self.rng.random(dists.shape), -1.0).argmax(axis=1)
+
+        left = sites1[rows, picks]
+        right = sites2[rows, picks]
+        left_qubits = self.qubits1[picks]
+        right_qubits = self.qubits2[picks]
+
+        moving = np.flatnonzero(self.dist[left, right] > 1)
+
+        while len(moving):
+
+            next_left = self.next_hop[left[moving], right[moving]].astype(np.intp)
+            next_right = self.next_hop[right[moving], left[moving]].astype(np.intp)
+
+            dist_change_l = self.calc_swap_deltas(moving, left[moving], next_left, left_qubits[moving], self.qubit_at_site[moving, next_left])
+            dist_change_r = self.calc_swap_deltas(moving, right[moving], next_right, right_qubits[moving], self.qubit_at_site[moving, next_right])
+
+            # The right qubit moves when the two are tied, the same as perform_next_swap
+            go_left = dist_change_l < dist_change_r
+            from_sites = np.where(go_left, left[moving], right[moving])
+            to_sites = np.where(go_left, next_left, next_right)
+
+            to_qubits = self.qubit_at_site[moving, to_sites]
+            self.add_moves(moving, "s", self.qubit_at_site[moving, from_sites],
+                           np.where(to_qubits != -1, to_qubits, empty_site_label(to_sites)))
+            self.swap_sites(moving, from_sites, to_sites)
+            self.swap_nums[moving] += 1
+
+            left[moving] = np.where(go_left, next_left, left[moving])
+            right[moving] = np.where(go_left, right[moving], next_right)
+
+            moving = moving[self.dist[left[moving], right[moving]] > 1]